@@ -1,9 +1,11 @@
+import asyncio
 from langchain_core.messages import HumanMessage, SystemMessage
 from typing import List, Dict
 
 from urllib3 import request
 from core.llm import get_llm
 from core.issue_state import IssueState
+from core.resources import ResourceRegistry, get_resources
 
 
 
@@ -12,17 +14,52 @@ class ClassifierAgent:
     Issue 评论分类与分析 Agent
     """
 
-    def __init__(self):
+    def __init__(self, llm=None, pre_classifier=None, summarizer=None, max_comments: int = 20, max_comment_chars: int = 500):
         """
         初始化模型，可以替换为 DeepSeek、Moonshot 等兼容OpenAI API的模型。
+        - llm: 外部注入的共享 LLM 实例（见 core.resources），不传则新建
+        - pre_classifier: 可选的本地预分类器（见 agents.pre_classifier），高置信时跳过 LLM
+        - summarizer: 可选的摘要 Agent（见 agents.summary_agent），只读取上次回复前存下的讨论摘要，不调用 LLM
+        - max_comments / max_comment_chars: Prompt 中最多带的最新评论数与单条评论的字数上限，Prompt 大小有界
         """
-        self.llm = get_llm()
+        self.llm = llm or get_llm()
+        self.pre_classifier = pre_classifier
+        self.summarizer = summarizer
+        self.max_comments = max_comments
+        self.max_comment_chars = max_comment_chars
 
-    def analyze_comments(self, issue_state: IssueState) -> IssueState:
+    def _fast_path(self, issue_state: IssueState, decision: dict | None) -> bool:
+        """预分类结果足够可信时直接写入状态，返回是否已跳过 LLM"""
+        if decision is None or not self.pre_classifier.accept(decision):
+            return False
+        self.pre_classifier.record(issue_state, decision)
+        issue_state.update({
+            "need_reply": decision["need_reply"],
+            "reason": decision["reason"],
+            "category": decision["category"],
+        })
+        return True
+
+    def _record_llm(self, issue_state: IssueState, decision: dict | None):
+        if decision is not None:
+            self.pre_classifier.record(issue_state, decision, llm_result={
+                "need_reply": issue_state.get("need_reply"),
+                "category": issue_state.get("category"),
+            })
+
+    def _build_messages(self, issue_state: IssueState) -> list:
         """
-        分析一条 Issue 的评论，判断是否需要回复
+        构造分类 Prompt：已存的讨论摘要 + 摘要之后的最新评论（逐条截断），Prompt 大小不随讨论长度增长
+        分类在本次摘要更新之前执行，摘要覆盖到上次回复时的讨论；SQLite 读取，调用方应在线程中执行
         """
-        text = "\n".join([f"- {c}" for c in issue_state["comments"]])
+        if self.summarizer is not None:
+            summary, comments = self.summarizer.cached(issue_state)
+        else:
+            summary, comments = "", [str(c) for c in issue_state["comments"]]
+        comments = comments[-self.max_comments:]
+        text = "\n".join([f"- {c[:self.max_comment_chars]}" for c in comments])
+        if summary:
+            text = f"此前讨论的摘要：\n{summary}\n\n最新评论：\n{text}"
         messages = [
             SystemMessage(
                 content=(
@@ -38,11 +75,44 @@ class ClassifierAgent:
             ),
             HumanMessage(content=f"以下是Issue的评论内容：\n{text}")
         ]
+        return messages
+
+    def analyze_comments(self, issue_state: IssueState) -> IssueState:
+        """
+        分析一条 Issue 的评论，判断是否需要回复
+        """
+        decision = self.pre_classifier.classify(issue_state["comments"]) if self.pre_classifier else None
+        if self._fast_path(issue_state, decision):
+            return issue_state
+
+        messages = self._build_messages(issue_state)
         try:
             result = self.llm.invoke(messages).content
         except Exception as e:
             result = f'{{"need_reply": false, "reason": "LLM调用失败: {e}", "category": "unknown"}}'
-        return self._parse_output(issue_state=issue_state, text=result)
+        issue_state = self._parse_output(issue_state=issue_state, text=result)
+        self._record_llm(issue_state, decision)
+        return issue_state
+
+    async def aanalyze_comments(self, issue_state: IssueState) -> IssueState:
+        """
+        analyze_comments 的异步版本，LLM 调用不阻塞事件循环
+        """
+        decision = None
+        if self.pre_classifier:
+            # 预分类包含一次向量计算，放到线程中执行
+            decision = await asyncio.to_thread(self.pre_classifier.classify, issue_state["comments"])
+        if self._fast_path(issue_state, decision):
+            return issue_state
+
+        messages = await asyncio.to_thread(self._build_messages, issue_state)
+        try:
+            result = (await self.llm.ainvoke(messages)).content
+        except Exception as e:
+            result = f'{{"need_reply": false, "reason": "LLM调用失败: {e}", "category": "unknown"}}'
+        issue_state = self._parse_output(issue_state=issue_state, text=result)
+        self._record_llm(issue_state, decision)
+        return issue_state
 
     def _parse_output(self, issue_state: IssueState, text: str) -> IssueState:
         import json, re
@@ -69,11 +139,17 @@ class ClassifierAgent:
         return issue_state
 
 
-from agents.classifier_agent import ClassifierAgent
-def classify_node(state: IssueState):
-    agent = ClassifierAgent()
+def classify_node(state: IssueState, resources: ResourceRegistry | None = None):
+    """Graph节点包装，复用注册表中预热好的 Agent"""
+    agent = (resources or get_resources()).classifier
     return agent.analyze_comments(state)
 
+
+async def aclassify_node(state: IssueState, resources: ResourceRegistry | None = None):
+    """Graph异步节点包装"""
+    agent = (resources or get_resources()).classifier
+    return await agent.aanalyze_comments(state)
+
 if __name__ == "__main__":
     import json
     import requests
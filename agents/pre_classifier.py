@@ -0,0 +1,289 @@
+# agents/pre_classifier.py
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+
+# 明确表示问题已解决 / 致谢 / 关闭（"解决"需带完成语气，且前面不能是否定词）
+RESOLVED_PATTERNS = [
+    r"(已经|已)(解决|搞定)|(?<![没未不])(?<!没有)(解决|搞定)了",
+    r"(?<![不没])(可以|好)了",
+    r"没(有)?问题了",
+    r"谢谢|感谢|多谢",
+    r"\b(thanks|thank you|thx)\b",
+    r"\b(solved|resolved|fixed)\b",
+    r"\bit works\b|\bworks now\b|\bworking now\b",
+    r"\bclos(e|ing) (this|the issue)\b",
+]
+
+# 明确表示问题仍存在 / 请求帮助 / 催促
+OPEN_PATTERNS = [
+    r"还是不行|仍然|依然|依旧|还是报错|还有问题|没(有)?解决|未解决|崩溃|闪退",
+    r"还是.{0,6}(失败|报错|出错|不行|崩)|问题(还在|仍在)",
+    r"怎么办|求助|帮忙|请问|有人(知道|遇到)",
+    r"(有)?进展吗|什么时候(能|可以)?(修复|解决)",
+    r"\bany (update|progress|news)\b",
+    r"\bstill\b.{0,20}\b(broken|fail\w*|crash\w*|error\w*|not work\w*|happen\w*|an issue|seeing|the same)\b",
+    r"\bcrash(es|ed|ing)?\b",
+    r"\b(doesn'?t|does not|didn'?t) work\b",
+    r"\bhelp\b",
+    r"traceback|exception|报错|错误",
+]
+
+# 提问句式：询问做法或是否已好，需要回复，不能按"已解决"或"给出方案"处理
+QUESTION_PATTERNS = [
+    r"[？?]",
+    r"吗|怎么|如何|怎样|能否|是否|为什么|为啥",
+    r"^\s*(how|what|why|when|where|can|could|would|is|are|does|do|did|any)\b",
+]
+
+# 转折：致谢后接"仍有问题"时以后者为准
+CONTRAST_PATTERNS = [r"但|不过|可是|然而", r"\b(but|however|though)\b"]
+
+# 用户描述自己做过的尝试，不是他人给出的方案
+SELF_ATTEMPT_PATTERNS = [
+    r"我(们)?(也)?(已经|已)?(尝试|试了|试过|试着|按照)",
+    r"\bI('ve| have)? (tried|also tried|followed)\b",
+]
+
+# 他人给出解决方案、等待用户确认（对应 LLM 判断规则 3：无需回复），须是对提问者提出的建议
+PROPOSAL_PATTERNS = [
+    r"(可以|请|建议|不妨)(你|您)?(先)?(试试|尝试|试一下|试着)",
+    r"(你|您)(可以)?(先)?(试试|尝试|试一下)",
+    r"(可以|请|建议)(你|您)?(先)?(升级|更新|修改|设置|参考|检查)",
+    r"(已|已经)在.{0,20}(修复|解决)|修复.{0,10}(已合并|已发布)",
+    r"\b(try|you (can|could|should|need to)|please (try|upgrade|update|check|set))\b",
+    r"\b(should (fix|solve|resolve)|fixed in|workaround)\b",
+    r"\bPR\s*#\d+|\bpull/\d+",
+]
+
+# 用于向量相似度判断的原型句
+RESOLVED_EXAMPLES = [
+    "问题已经解决了，谢谢",
+    "按照你的方法操作后可以了，感谢",
+    "好的，已经没问题了，可以关闭这个 issue",
+    "Thanks, it works now.",
+    "Solved, closing this issue.",
+]
+OPEN_EXAMPLES = [
+    "还是不行，依然报同样的错误",
+    "请问这个问题有进展吗？",
+    "按照步骤操作了还是失败，怎么办",
+    "Still broken on the latest version, any update?",
+    "I have the same problem, please help.",
+]
+
+
+class PreClassifier:
+    """
+    LLM 之前的轻量预分类器
+    - 规则（正则关键词）+ 本地向量模型，判断最后一条评论是否明显已解决 / 明显待回复 / 他人已给出方案待确认
+    - 置信度不低于阈值时直接给出结果，跳过 LLM；否则交给 LLM
+    - 每次决策写入 JSONL 日志；走 LLM 的样本同时记录预分类结果，用于评估精度
+    - shadow_rate: 对高置信样本按比例仍调用 LLM 做对照，持续监控精度
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        threshold: float = 0.85,
+        shadow_rate: float = 0.0,
+        log_path: Optional[str] = "data/pre_classifier.jsonl",
+        max_comment_chars: int = 300,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.shadow_rate = shadow_rate
+        self.log_path = log_path
+        self.max_comment_chars = max_comment_chars
+
+        self._resolved_re = [re.compile(p, re.IGNORECASE) for p in RESOLVED_PATTERNS]
+        self._open_re = [re.compile(p, re.IGNORECASE) for p in OPEN_PATTERNS]
+        self._proposal_re = [re.compile(p, re.IGNORECASE) for p in PROPOSAL_PATTERNS]
+        self._question_re = [re.compile(p, re.IGNORECASE) for p in QUESTION_PATTERNS]
+        self._contrast_re = [re.compile(p, re.IGNORECASE) for p in CONTRAST_PATTERNS]
+        self._self_attempt_re = [re.compile(p, re.IGNORECASE) for p in SELF_ATTEMPT_PATTERNS]
+        self._prototypes: Optional[tuple[np.ndarray, np.ndarray]] = None
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()  # 计数在执行器线程中更新
+        self.counters = {"total": 0, "fast_path": 0, "llm_calls": 0, "shadow_total": 0, "shadow_agree": 0}
+
+    @staticmethod
+    def _comment_text(comment) -> str:
+        if isinstance(comment, dict):
+            return str(comment.get("body") or "")
+        return str(comment or "")
+
+    def _rule_vote(self, text: str) -> tuple[Optional[bool], bool]:
+        """
+        规则投票：返回 (投票, 是否为待确认的解决方案)
+        投票 True=需要回复，False=无需回复，None=无法判断
+        - 提问句式视为需要回复，不计"已解决"与"给出方案"
+        - 他人给出方案、用户尚未确认（规则 3）时无需回复；方案与"仍有问题"同时出现时无法判断
+        - 用户自述的尝试（"我尝试了…"）不算方案；"已解决"与"仍有问题"同时出现时，有转折词则以后者为准
+        """
+        question = any(r.search(text) for r in self._question_re)
+        resolved = not question and any(r.search(text) for r in self._resolved_re)
+        still_open = question or any(r.search(text) for r in self._open_re)
+        proposal = (
+            not question
+            and any(r.search(text) for r in self._proposal_re)
+            and not any(r.search(text) for r in self._self_attempt_re)
+        )
+        if proposal:
+            return (None if still_open else False), True
+        if resolved and still_open:
+            return (True if any(r.search(text) for r in self._contrast_re) else None), False
+        if resolved == still_open:
+            return None, False
+        return still_open, False
+
+    def _embedding_vote(self, text: str) -> tuple[Optional[bool], float]:
+        """向量投票：比较与两类原型句的最大余弦相似度，返回 (投票, 差值)"""
+        if self.embeddings is None:
+            return None, 0.0
+        if self._prototypes is None:
+            with self._lock:
+                if self._prototypes is None:
+                    self._prototypes = (
+                        self._normalize(self.embeddings.embed_documents(RESOLVED_EXAMPLES)),
+                        self._normalize(self.embeddings.embed_documents(OPEN_EXAMPLES)),
+                    )
+        resolved, still_open = self._prototypes
+        query = self._normalize([self.embeddings.embed_query(text)])[0]
+        margin = float((still_open @ query).max() - (resolved @ query).max())
+        if abs(margin) < 0.02:
+            return None, margin
+        return margin > 0, margin
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        arr = np.asarray(vectors, dtype=np.float32)
+        return arr / np.maximum(np.linalg.norm(arr, axis=1, keepdims=True), 1e-12)
+
+    def classify(self, comments: list) -> dict:
+        """返回 {"need_reply", "confidence", "reason", "category"}"""
+        if not comments:
+            return {
+                "need_reply": True,
+                "confidence": 0.95,
+                "reason": "新建 Issue，暂无评论",
+                "category": "new_issue",
+            }
+
+        text = self._comment_text(comments[-1]).strip()
+        rule, proposal = self._rule_vote(text)
+        embedding, margin = self._embedding_vote(text)
+        if proposal and embedding is True:
+            # 原型句不覆盖"给出方案"，向量判为待回复时不可信，交给规则
+            embedding = None
+
+        votes = [v for v in (rule, embedding) if v is not None]
+        if not votes or len(set(votes)) > 1:
+            need_reply, confidence = True, 0.5
+        else:
+            need_reply = votes[0]
+            confidence = 0.75 if len(votes) == 1 else 0.9
+            if embedding is not None:
+                confidence += min(abs(margin), 0.05)
+        # 长评论通常包含新的技术细节，降低置信度交给 LLM
+        if len(text) > self.max_comment_chars:
+            confidence -= 0.2
+
+        return {
+            "need_reply": need_reply,
+            "confidence": round(confidence, 3),
+            "reason": f"预分类：规则={rule}，向量={embedding}（差值 {margin:.3f}）",
+            "category": "follow_up" if need_reply else ("awaiting_confirmation" if proposal else "resolved"),
+        }
+
+    def accept(self, decision: dict) -> bool:
+        """高置信且未被抽中做对照时，直接采用预分类结果"""
+        if decision["confidence"] < self.threshold:
+            accepted = False
+        elif self.shadow_rate and random.random() < self.shadow_rate:
+            decision["shadow"] = True
+            accepted = False
+        else:
+            accepted = True
+        with self._counter_lock:
+            self.counters["total"] += 1
+            self.counters["fast_path" if accepted else "llm_calls"] += 1
+        return accepted
+
+    def record(self, issue_state: dict, decision: dict, llm_result: Optional[dict] = None):
+        """记录决策；llm_result 非空时同时记录 LLM 结论，用于离线评估预分类精度"""
+        if decision.get("shadow") and llm_result is not None:
+            with self._counter_lock:
+                self.counters["shadow_total"] += 1
+                self.counters["shadow_agree"] += decision["need_reply"] == llm_result["need_reply"]
+        if not self.log_path:
+            return
+        entry = {
+            "ts": time.time(),
+            "issue_url": issue_state.get("issue_url"),
+            "source": "pre" if llm_result is None else "llm",
+            "pre": decision,
+            "llm": llm_result,
+        }
+        with self._lock:
+            if os.path.dirname(self.log_path):
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        total = counters["total"]
+        shadow = counters["shadow_total"]
+        return {
+            **counters,
+            "llm_avoided_ratio": round(counters["fast_path"] / total, 3) if total else None,
+            "shadow_precision": round(counters["shadow_agree"] / shadow, 3) if shadow else None,
+        }
+
+
+# 规则投票的对照表：(评论, 期望投票, 期望是否为方案)，修改规则后运行 python -m agents.pre_classifier 检查
+RULE_CASES = [
+    ("问题已经解决了，谢谢", False, False),
+    ("按照你的方法操作后可以了，感谢", False, False),
+    ("Thanks, it works now.", False, False),
+    ("如何解决这个问题？", True, False),
+    ("这个问题怎么解决", True, False),
+    ("可以了吗？", True, False),
+    ("还没解决", True, False),
+    ("我尝试了重启，问题依旧", True, False),
+    ("Could you please check this?", True, False),
+    ("Thanks for the reply, but it still crashes", True, False),
+    ("Still broken on the latest version", True, False),
+    ("可以试试升级到最新版本", False, True),
+    ("建议你先检查一下配置文件", False, True),
+    ("You could try setting the timeout to 60.", False, True),
+    ("已在 v1.2 中修复，请升级后确认", False, True),
+]
+
+
+def check_rules(cases: list = RULE_CASES) -> list:
+    """逐条比对规则投票，返回不符合期望的条目"""
+    pre = PreClassifier(log_path=None)
+    failures = []
+    for text, vote, proposal in cases:
+        got = pre._rule_vote(text)
+        if got != (vote, proposal):
+            failures.append({"text": text, "expected": (vote, proposal), "got": got})
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_rules()
+    for f in failures:
+        print(f"❌ {f['text']}: 期望 {f['expected']}，实际 {f['got']}")
+    print(f"✅ 规则检查：{len(RULE_CASES) - len(failures)}/{len(RULE_CASES)} 通过")
+    raise SystemExit(1 if failures else 0)
@@ -1,30 +1,29 @@
 # agents/reply_agent.py
+import asyncio
+
 from langchain_core.messages import HumanMessage, SystemMessage
 from core.llm import get_llm
 from core.issue_state import IssueState
+from core.context_packer import ContextPacker
+from core.resources import ResourceRegistry, get_resources
 
 class ReplyAgent:
     """
     Issue 回复生成 Agent
     根据检索结果与当前 Issue 内容，自动生成专业、简洁的回复。
+    - packer: 上下文打包器（见 core.context_packer），按 token 预算放入正文、最新评论与检索文档
     """
 
-    def __init__(self):
-        self.llm = get_llm()
+    # 模板中标题、分隔符等固定文本的预留 token 数
+    TEMPLATE_TOKENS = 64
 
-    def run(self, state: IssueState) -> IssueState:
-        """
-        基于上下文 + 检索内容生成回复
-        """
-        issue_title = state.get("issue_title", "")
-        issue_body = state.get("issue_body", "")
-        retrieved_docs = state.get("retrieved_docs", [])
-
-        # 拼接上下文内容
-        related_context = ""
-        for i, doc in enumerate(retrieved_docs[:5]):
-            related_context += f"\n[相似问题{i+1}]\n标题: {doc.metadata.get('title', 'N/A')}\n内容: {doc.page_content[:500]}...\n"
+    def __init__(self, llm=None, packer: ContextPacker | None = None):
+        self.llm = llm or get_llm()
+        self.packer = packer or ContextPacker()
 
+    def _build_messages(self, state: IssueState) -> list:
+        """根据 Issue 内容与检索结果构造回复 Prompt"""
+        issue_title = state.get("issue_title", "")
         system_prompt = (
             "你是一名资深的 GitHub 项目维护者，擅长用中文回答技术问题。\n"
             "你的回复必须明确指出问题所在，不能泛泛而谈。\n"
@@ -33,12 +32,33 @@ class ReplyAgent:
             "要求回复自然、有帮助，可以直接用于评论区。"
         )
 
+        packed = self.packer.pack(
+            issue_title,
+            state.get("issue_body", ""),
+            state.get("recent_comments") or state.get("comments", []),
+            state.get("retrieved_docs", []),
+            reserved=self.packer.counter.count(system_prompt) + self.TEMPLATE_TOKENS,
+            summary=state.get("thread_summary", ""),
+        )
+        print(f"📦 上下文 {packed['tokens']} tokens（评论 {len(packed['comments'])} 条，相似问题 {len(packed['docs'])} 条）")
+
+        # 拼接上下文内容
+        related_context = ""
+        for i, (title, content) in enumerate(packed["docs"]):
+            related_context += f"\n[相似问题{i+1}]\n标题: {title}\n内容: {content}\n"
+        recent_comments = "\n".join(f"- {c}" for c in packed["comments"])
+        if packed["summary"]:
+            recent_comments = f"（此前讨论摘要）{packed['summary']}\n{recent_comments}"
+
         human_prompt = f"""
 # Issue标题
 {issue_title}
 
 # Issue内容
-{issue_body}
+{packed["body"]}
+
+# 最新评论
+{recent_comments if recent_comments else "（暂无评论）"}
 
 # 检索到的相似问题
 {related_context if related_context else "（未检索到相似问题）"}
@@ -48,7 +68,13 @@ class ReplyAgent:
             SystemMessage(content=system_prompt),
             HumanMessage(content=human_prompt),
         ]
+        return messages
 
+    def run(self, state: IssueState) -> IssueState:
+        """
+        基于上下文 + 检索内容生成回复
+        """
+        messages = self._build_messages(state)
         try:
             reply = self.llm.invoke(messages).content.strip()
         except Exception as e:
@@ -58,13 +84,34 @@ class ReplyAgent:
         print("💬 生成回复:\n", reply)
         return state
 
+    async def arun(self, state: IssueState, executor=None) -> IssueState:
+        """
+        run 的异步版本，LLM 调用不阻塞事件循环
+        - 上下文打包包含分词与向量计算，在 executor（不传则为默认线程池）中执行
+        """
+        messages = await asyncio.get_running_loop().run_in_executor(executor, self._build_messages, state)
+        try:
+            reply = (await self.llm.ainvoke(messages)).content.strip()
+        except Exception as e:
+            reply = f"LLM 生成回复失败: {e}"
+
+        state["reply_text"] = reply
+        print("💬 生成回复:\n", reply)
+        return state
+
 
-def reply_node(state: IssueState) -> IssueState:
-    """Graph节点包装"""
-    agent = ReplyAgent()
+def reply_node(state: IssueState, resources: ResourceRegistry | None = None) -> IssueState:
+    """Graph节点包装，复用注册表中预热好的 Agent"""
+    agent = (resources or get_resources()).replier
     return agent.run(state)
 
 
+async def areply_node(state: IssueState, resources: ResourceRegistry | None = None) -> IssueState:
+    """Graph异步节点包装"""
+    resources = resources or get_resources()
+    return await resources.replier.arun(state, executor=resources.executor)
+
+
 if __name__ == "__main__":
     from langchain_core.documents import Document
 
@@ -0,0 +1,167 @@
+# agents/rerank_agent.py
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from core.issue_state import IssueState
+from core.resources import ResourceRegistry, get_resources
+
+
+class RerankAgent:
+    """
+    交叉编码器重排
+    - 检索阶段多取候选（RERANK_CANDIDATES），由本地 CrossEncoder 对 (Issue, 文档) 逐对打分后取前 top_n 条
+    - 批量推理；打分结果按 (查询, 文档) 做 LRU 缓存，同一 Issue 的后续事件不重复计算
+    - budget_ms: 时间预算，超时后退回检索原顺序；超时的打分仍在后台完成并写入缓存
+    - 推理在专用的单线程池中执行，不占用检索与回复共用的 CPU 线程池；
+      上一批打分尚未结束时直接跳过重排，超时的推理不会在后台堆积
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        top_n: int = 5,
+        batch_size: int = 16,
+        budget_ms: float = 300,
+        cache_size: int = 4096,
+        max_length: int = 512,
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, max_length=max_length)
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.budget = budget_ms / 1000
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._slot = threading.Lock()  # 同一时间只有一批推理
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="issue-rerank")
+        self.counters = {"calls": 0, "timeouts": 0, "skipped": 0, "errors": 0, "scored": 0, "cache_hits": 0}
+
+    @staticmethod
+    def _query(state: IssueState) -> str:
+        return f"{state.get('issue_title', '')}\n{state.get('issue_body', '')}"
+
+    def _key(self, query: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{query}\0{text}".encode("utf-8")).hexdigest()
+
+    def score(self, query: str, docs: list) -> list[float]:
+        """返回每个文档的相关性分数；只对缓存未命中的文档做一次批量推理"""
+        keys = [self._key(query, doc.page_content) for doc in docs]
+        with self._lock:
+            scores = {k: self._cache[k] for k in keys if k in self._cache}
+            for k in scores:
+                self._cache.move_to_end(k)
+        self.counters["cache_hits"] += len(scores)
+
+        missing = [(k, doc) for k, doc in zip(keys, docs) if k not in scores]
+        if missing:
+            pairs = [(query, doc.page_content) for _, doc in missing]
+            predicted = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            self.counters["scored"] += len(missing)
+            with self._lock:
+                for (k, _), value in zip(missing, predicted):
+                    scores[k] = self._cache[k] = float(value)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [scores[k] for k in keys]
+
+    def rerank(self, query: str, docs: list) -> list:
+        scores = self.score(query, docs)
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[: self.top_n]]
+
+    def _rerank_in_slot(self, query: str, docs: list) -> list:
+        try:
+            return self.rerank(query, docs)
+        finally:
+            self._slot.release()
+
+    def _submit(self, query: str, docs: list):
+        """提交到专用线程池；上一批仍在推理时返回 None"""
+        if not self._slot.acquire(blocking=False):
+            self.counters["skipped"] += 1
+            return None
+        try:
+            return self.executor.submit(self._rerank_in_slot, query, docs)
+        except BaseException:
+            self._slot.release()
+            raise
+
+    def _apply(self, state: IssueState, ranked: list | None, start: float, skipped: bool = False) -> IssueState:
+        docs = state.get("retrieved_docs", [])
+        if ranked is None:
+            state["retrieved_docs"] = docs[: self.top_n]
+            if skipped:
+                print("⏭️ 上一批重排仍在进行，使用检索原顺序")
+            else:
+                print(f"⏱️ 重排未在 {self.budget * 1000:.0f}ms 内完成，使用检索原顺序")
+        else:
+            state["retrieved_docs"] = ranked
+            print(f"🎯 重排 {len(docs)} 条候选，保留 {len(ranked)} 条（{(time.perf_counter() - start) * 1000:.0f}ms）")
+        return state
+
+    def run(self, state: IssueState) -> IssueState:
+        """对检索结果重排，打分在专用线程池中执行并受时间预算约束"""
+        docs = state.get("retrieved_docs", [])
+        if len(docs) <= 1:
+            return state
+        self.counters["calls"] += 1
+        start = time.perf_counter()
+        future = self._submit(self._query(state), docs)
+        if future is None:
+            return self._apply(state, None, start, skipped=True)
+        try:
+            ranked = future.result(timeout=self.budget)
+        except FutureTimeoutError:
+            self.counters["timeouts"] += 1
+            ranked = None
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"⚠️ 重排失败: {e}")
+            ranked = None
+        return self._apply(state, ranked, start)
+
+    async def arun(self, state: IssueState) -> IssueState:
+        """run 的异步版本，等待受时间预算约束"""
+        docs = state.get("retrieved_docs", [])
+        if len(docs) <= 1:
+            return state
+        self.counters["calls"] += 1
+        start = time.perf_counter()
+        submitted = self._submit(self._query(state), docs)
+        if submitted is None:
+            return self._apply(state, None, start, skipped=True)
+        # 用 shield 保护线程池任务：超时只放弃等待，后台打分完成后仍会写入缓存
+        future = asyncio.wrap_future(submitted)
+        try:
+            ranked = await asyncio.wait_for(asyncio.shield(future), timeout=self.budget)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            ranked = None
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"⚠️ 重排失败: {e}")
+            ranked = None
+        return self._apply(state, ranked, start)
+
+    def stats(self) -> dict:
+        return {**self.counters, "cache_size": len(self._cache)}
+
+
+def rerank_node(state: IssueState, resources: ResourceRegistry | None = None) -> IssueState:
+    """Graph节点包装，复用注册表中预热好的重排模型"""
+    resources = resources or get_resources()
+    return resources.reranker.run(state)
+
+
+async def arerank_node(state: IssueState, resources: ResourceRegistry | None = None) -> IssueState:
+    """Graph异步节点包装"""
+    resources = resources or get_resources()
+    return await resources.reranker.arun(state)
@@ -1,34 +1,146 @@
 # retriever_agent.py
-from langchain_chroma import Chroma
+import asyncio
+import threading
 from typing import List
 from core.issue_state import IssueState
-from scripts.build import LocalEmbeddings
+from core.resources import ResourceRegistry, get_resources
+from core.embeddings import LocalEmbeddings
+from core.vector_index import NumpyVectorIndex, detect_index_type
+from core.lexical_index import BM25Index, reciprocal_rank_fusion
+
+
+def _open_chroma(persist_dir: str):
+    """
+    为该索引目录新建并持有一个 chromadb System，返回 (system, client)
+    PersistentClient 按路径共享 System 且没有公开的关闭方法；自建的 System 退役时直接 stop()，
+    同一路径上的其他实例各自持有 System，互不影响
+    """
+    from chromadb.api import ServerAPI
+    from chromadb.api.client import Client
+    from chromadb.config import Settings, System
+
+    system = System(Settings(is_persistent=True, persist_directory=persist_dir))
+    system.instance(ServerAPI)
+    system.start()
+    return system, Client.from_system(system)
+
 
 class RetrieverAgent:
-    def __init__(self, persist_dir="data/chroma_db", model_name="BAAI/bge-small-zh"):
+    def __init__(self, persist_dir="data/chroma_db", model_name="BAAI/bge-small-zh", embeddings=None, index_type=None, k=5, hybrid=True):
+        """
+        - index_type: 索引类型（chroma / numpy），不传则按 persist_dir 下的 index.json 自动识别
+        - k: 返回的文档数
+        - hybrid: persist_dir 下存在 BM25 索引时，融合词法与向量检索结果
+        """
         self.persist_dir = persist_dir
-        self.embeddings = LocalEmbeddings(model_name=model_name)
-        self.db = Chroma(
-            collection_name="issues",
-            persist_directory=persist_dir,
-            embedding_function=self.embeddings
+        self._chroma_system = None
+        self.embeddings = embeddings or LocalEmbeddings(model_name=model_name)
+        self.index_type = index_type or detect_index_type(persist_dir)
+        if self.index_type == "numpy":
+            self.db = NumpyVectorIndex(persist_dir, self.embeddings)
+        else:
+            from langchain_chroma import Chroma
+            self._chroma_system, client = _open_chroma(persist_dir)
+            self.db = Chroma(
+                collection_name="issues",
+                client=client,
+                embedding_function=self.embeddings
+            )
+        self.k = k
+        self.lexical = BM25Index.load(persist_dir) if hybrid and BM25Index.exists(persist_dir) else None
+
+        # 热加载时旧实例被标记为退役，等进行中的检索全部结束后再释放索引
+        self._active = 0
+        self._retired = False
+        self._state_lock = threading.Lock()
+
+    def acquire(self):
+        with self._state_lock:
+            self._active += 1
+
+    def release(self):
+        with self._state_lock:
+            self._active -= 1
+            close = self._retired and self._active == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        """标记为退役：无进行中的检索时立即释放，否则由最后一次 release 释放"""
+        with self._state_lock:
+            self._retired = True
+            close = self._active == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        """
+        释放向量库与 BM25 索引
+        - NumPy / BM25：释放引用，mmap 与内存随对象回收
+        - Chroma：停止本实例持有的 chromadb System，否则其 SQLite 句柄与 HNSW 段会一直驻留到进程退出
+        """
+        if self._chroma_system is not None:
+            try:
+                self._chroma_system.stop()
+            except Exception as e:
+                print(f"⚠️ 释放 Chroma 资源失败（{self.persist_dir}）: {e}")
+            self._chroma_system = None
+        self.db = None
+        self.lexical = None
+        print(f"🗑️ 已释放旧索引：{self.persist_dir}")
+
+    def search(self, query_text: str, k: int | None = None) -> list:
+        """
+        检索最相关的 k 条文档
+        有 BM25 索引时，两路各取 4k 个候选，按倒数排名融合（RRF）后取前 k 条，
+        以补足向量检索对报错信息、配置项、版本号等精确匹配的不足
+        """
+        k = k or self.k
+        if self.lexical is None:
+            return self.db.similarity_search(query_text, k=k)
+        candidates = k * 4
+        return reciprocal_rank_fusion(
+            [self.db.similarity_search(query_text, k=candidates), self.lexical.search(query_text, k=candidates)],
+            top_n=k,
         )
 
-    def run(self, state: IssueState) -> IssueState:
-        """检索与当前 Issue 相关的历史 Issue 或 FAQ"""
+    def run(self, state: IssueState, k: int | None = None) -> IssueState:
+        """检索与当前 Issue 相关的历史 Issue 或 FAQ；k 不传则使用默认条数"""
         query_text = f"{state['issue_title']}\n{state['issue_body']}"
-        results = self.db.similarity_search(query_text, k=5)
+        results = self.search(query_text, k)
 
         state["retrieved_docs"] = results
         print(f"🔍 检索到 {len(results)} 条相关文档")
 
         return state
 
+    async def arun(self, state: IssueState, executor=None) -> IssueState:
+        """
+        run 的异步版本
+        - 向量化与相似度检索是 CPU 密集操作，放到线程池执行，避免阻塞事件循环
+        - executor: 指定线程池，不传则使用事件循环默认线程池
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.run, state)
 
-def retriever_node(state: IssueState) -> IssueState:
-    """Graph节点包装"""
-    agent = RetrieverAgent()
-    return agent.run(state)
+
+def retriever_node(state: IssueState, resources: ResourceRegistry | None = None, k: int | None = None) -> IssueState:
+    """
+    Graph节点包装，复用注册表中已加载的模型与向量库；检索期间持有索引，热加载不会中途释放
+    - k: 检索条数，开启重排时为候选数
+    """
+    with (resources or get_resources()).lease_retriever() as agent:
+        return agent.run(state, k)
+
+
+async def aretriever_node(state: IssueState, resources: ResourceRegistry | None = None, k: int | None = None) -> IssueState:
+    """
+    Graph异步节点包装
+    在 CPU 线程池中获取并持有索引，协程被取消时线程内的检索仍能在原索引上完成
+    """
+    resources = resources or get_resources()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(resources.executor, retriever_node, state, resources, k)
 
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@ import json
 import asyncio
 import aiohttp
 from core.llm import fast
+from core.mcp_session_pool import MCPSessionPool
 from fast_agent.agents.agent_types import AgentConfig
 from fast_agent.agents.tool_agent import ToolAgent
 from fast_agent.context import Context
@@ -50,12 +51,25 @@ instruction = """
     api_key=os.getenv("OPENAI_API_KEY"), 
     instruction=instruction, servers=["fetch", "github-issues-server"],
     tools=[send_feishu_message],
+    use_history=False,  # 会话长期复用，不同 Issue 之间不共享对话历史
     )
 async def review_agent(message: str):
-    async with fast.run() as agent:
+    # 会话池未就绪时限时等待，超时抛出由任务队列重试，不再逐条临时拉起 MCP server
+    await review_pool.wait_started(REVIEW_POOL_WAIT)
+    async with review_pool.session() as agent:
         result = await agent.send(message)
-        print("模型决策输出：", result)
-        return result
+    print("模型决策输出：", result)
+    return result
+
+
+# 长连接会话池：服务启动时打开，会话数即 review 并发上限
+review_pool = MCPSessionPool(
+    fast.run,
+    size=int(os.getenv("REVIEW_POOL_SIZE", "1")),
+    health_interval=float(os.getenv("REVIEW_POOL_HEALTH_INTERVAL", "30")),
+)
+# 等待会话池就绪的最长时间（秒）
+REVIEW_POOL_WAIT = float(os.getenv("REVIEW_POOL_WAIT", "60"))
 
 
 # =========================
@@ -63,7 +77,11 @@ async def review_agent(message: str):
 # =========================
 async def main():
     message = "用户提了一个无法匹配FAQ的问题，请判断是否要通知管理员。"
-    await review_agent(message)
+    await review_pool.start()
+    try:
+        await review_agent(message)
+    finally:
+        await review_pool.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,154 @@
+# agents/summary_agent.py
+import asyncio
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from core.llm import get_llm
+from core.issue_state import IssueState
+from core.resources import ResourceRegistry, get_resources
+from core.thread_summary import ThreadSummaryStore, fingerprint
+
+
+class SummaryAgent:
+    """
+    Issue 讨论的增量摘要
+    - 最新 keep_recent 条评论保留原文，更早的评论折叠进按 Issue 缓存的滚动摘要
+    - 每次事件只把上次之后新增的评论折叠进摘要，单次事件的 Prompt 大小不随讨论长度增长
+    - 已折叠评论被编辑或删除（指纹不一致）时从头重建摘要
+    """
+
+    SYSTEM_PROMPT = (
+        "你是 GitHub Issue 讨论摘要助手。"
+        "请将【已有摘要】与【新增评论】合并为一份新的摘要，保留："
+        "问题现象与报错、环境与版本、已尝试的方案及结果、维护者给出的结论、仍未解决的问题，以及关键用户。"
+        "去掉寒暄与重复内容，不超过 {max_chars} 字，只输出摘要正文。"
+    )
+
+    def __init__(
+        self,
+        llm=None,
+        store: ThreadSummaryStore | None = None,
+        keep_recent: int = 5,
+        fold_batch: int = 20,
+        max_comment_chars: int = 1000,
+        max_summary_chars: int = 800,
+    ):
+        self.llm = llm or get_llm()
+        self.store = store or ThreadSummaryStore()
+        self.keep_recent = keep_recent
+        self.fold_batch = fold_batch
+        self.max_comment_chars = max_comment_chars
+        self.max_summary_chars = max_summary_chars
+        self.counters = {"events": 0, "folded_comments": 0, "llm_calls": 0, "rebuilds": 0, "errors": 0}
+
+    @staticmethod
+    def _issue_key(state: IssueState) -> str:
+        issue_id = state.get("issue_id") or state.get("issue_number")
+        if state.get("repo_full_name") and issue_id:
+            return f"{state['repo_full_name']}#{issue_id}"
+        return state.get("issue_url") or f"#{issue_id}"
+
+    @staticmethod
+    def _comment_text(comment) -> str:
+        if isinstance(comment, dict):
+            return str(comment.get("body") or "")
+        return str(comment or "")
+
+    def _build_messages(self, summary: str, comments: list[str]) -> list:
+        text = "\n".join(f"- {c[:self.max_comment_chars]}" for c in comments)
+        return [
+            SystemMessage(content=self.SYSTEM_PROMPT.format(max_chars=self.max_summary_chars)),
+            HumanMessage(content=f"【已有摘要】\n{summary or '（无）'}\n\n【新增评论】\n{text}"),
+        ]
+
+    def cached(self, state: IssueState) -> tuple[str, list[str]]:
+        """
+        只读取已存的摘要，不调用 LLM：返回 (摘要, 摘要之后的评论原文)
+        摘要不存在或已折叠的评论被编辑、删除时，摘要为空并返回全部评论
+        """
+        comments = [self._comment_text(c) for c in state.get("comments", [])]
+        stored = self.store.get(self._issue_key(state))
+        if stored is None:
+            return "", comments
+        summary, folded, folded_hash = stored
+        if folded > len(comments) or fingerprint(comments[:folded]) != folded_hash:
+            return "", comments
+        return summary, comments[folded:]
+
+    def _plan(self, state: IssueState) -> tuple[str, list[str], list[str], int, str]:
+        """
+        计算本次需要折叠的评论
+        返回 (Issue 键, 全部评论, 待折叠的新评论, 已折叠数, 已有摘要)
+        """
+        comments = [self._comment_text(c) for c in state.get("comments", [])]
+        key = self._issue_key(state)
+        foldable = comments[:max(len(comments) - self.keep_recent, 0)]
+
+        summary, folded = "", 0
+        stored = self.store.get(key)
+        if stored is not None:
+            summary, folded, folded_hash = stored
+            if folded > len(foldable) or fingerprint(comments[:folded]) != folded_hash:
+                self.counters["rebuilds"] += 1
+                summary, folded = "", 0
+        return key, comments, foldable[folded:], folded, summary
+
+    def _finish(self, state: IssueState, comments: list[str], summary: str, folded: int) -> IssueState:
+        state["thread_summary"] = summary
+        # 正常情况下未折叠的只有最新 keep_recent 条；折叠失败时保留已有摘要并附上全部未折叠的原文，
+        # 不丢弃任何评论，由回复阶段的上下文打包按 token 预算从最新往前截取
+        state["recent_comments"] = comments[folded:]
+        return state
+
+    def run(self, state: IssueState) -> IssueState:
+        self.counters["events"] += 1
+        key, comments, pending, folded, summary = self._plan(state)
+        try:
+            for start in range(0, len(pending), self.fold_batch):
+                batch = pending[start:start + self.fold_batch]
+                summary = self.llm.invoke(self._build_messages(summary, batch)).content.strip()
+                folded += len(batch)
+                self.counters["llm_calls"] += 1
+                self.counters["folded_comments"] += len(batch)
+                self.store.put(key, summary, folded, fingerprint(comments[:folded]))
+        except Exception as e:
+            # 折叠失败时沿用已有摘要，下次事件继续从断点折叠
+            self.counters["errors"] += 1
+            print(f"⚠️ 讨论摘要更新失败: {e}")
+        if pending:
+            print(f"🧾 已折叠 {folded} 条评论进摘要，保留最新 {min(len(comments), self.keep_recent)} 条原文")
+        return self._finish(state, comments, summary, folded)
+
+    async def arun(self, state: IssueState) -> IssueState:
+        """run 的异步版本，LLM 调用不阻塞事件循环，SQLite 读写放到线程中执行"""
+        self.counters["events"] += 1
+        key, comments, pending, folded, summary = await asyncio.to_thread(self._plan, state)
+        try:
+            for start in range(0, len(pending), self.fold_batch):
+                batch = pending[start:start + self.fold_batch]
+                summary = (await self.llm.ainvoke(self._build_messages(summary, batch))).content.strip()
+                folded += len(batch)
+                self.counters["llm_calls"] += 1
+                self.counters["folded_comments"] += len(batch)
+                await asyncio.to_thread(self.store.put, key, summary, folded, fingerprint(comments[:folded]))
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"⚠️ 讨论摘要更新失败: {e}")
+        if pending:
+            print(f"🧾 已折叠 {folded} 条评论进摘要，保留最新 {min(len(comments), self.keep_recent)} 条原文")
+        return self._finish(state, comments, summary, folded)
+
+    def stats(self) -> dict:
+        return dict(self.counters)
+
+
+def summarize_node(state: IssueState, resources: ResourceRegistry | None = None) -> IssueState:
+    """Graph节点包装，复用注册表中的摘要 Agent"""
+    agent = (resources or get_resources()).summarizer
+    return agent.run(state)
+
+
+async def asummarize_node(state: IssueState, resources: ResourceRegistry | None = None) -> IssueState:
+    """Graph异步节点包装"""
+    agent = (resources or get_resources()).summarizer
+    return await agent.arun(state)
@@ -0,0 +1,190 @@
+# core/context_packer.py
+import re
+import threading
+from typing import Optional
+
+import numpy as np
+
+_CJK_RE = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+
+class TokenCounter:
+    """
+    按目标模型的分词器计数与截断
+    - tokenizer: HuggingFace 分词器名称（DeepSeek 为 deepseek-ai/DeepSeek-V3），首次使用时加载
+    - 分词器不可用（未安装 transformers / 无法下载）或传入 "heuristic" 时使用保守估算：
+      中文字符按 1 token、其他字符按 3 字符 1 token 计，宁可高估也不超出预算
+    """
+
+    def __init__(self, tokenizer: Optional[str] = "deepseek-ai/DeepSeek-V3"):
+        self.tokenizer_name = tokenizer
+        self._tokenizer = None
+        self._loaded = tokenizer in (None, "", "heuristic")
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        from transformers import AutoTokenizer
+                        self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                    except Exception as e:
+                        print(f"⚠️ 分词器 {self.tokenizer_name} 加载失败，改用估算计数: {e}")
+                    self._loaded = True
+        return self._tokenizer
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        cjk = len(_CJK_RE.findall(text))
+        return cjk + (len(text) - cjk + 2) // 3
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return self._estimate(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """截断到不超过 max_tokens，被截断时追加省略号"""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)
+            if len(ids) <= max_tokens:
+                return text
+            return self.tokenizer.decode(ids[:max_tokens - 1]) + "…"
+        if self._estimate(text) <= max_tokens:
+            return text
+        # 估算计数单调，二分查找最长前缀
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._estimate(text[:mid]) <= max_tokens - 1:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo] + "…"
+
+
+class ContextPacker:
+    """
+    回复 Prompt 的上下文打包
+    按优先级在 token 预算内放入：Issue 标题 > 正文 > 讨论摘要 > 最新评论 > 检索文档
+    - 正文、摘要、评论各有预算上限，未用完的额度顺延给检索文档
+    - 检索文档用最大边际相关性（MMR）选择，跳过与已选文档高度相似的文本块，再按单条上限截断填充
+    """
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        budget: int = 3000,
+        embeddings=None,
+        body_share: float = 0.3,
+        summary_share: float = 0.15,
+        comments_share: float = 0.25,
+        max_comment_tokens: int = 300,
+        max_doc_tokens: int = 400,
+        min_doc_tokens: int = 50,
+        mmr_lambda: float = 0.7,
+        dedup_threshold: float = 0.92,
+    ):
+        self.counter = counter or TokenCounter()
+        self.budget = budget
+        self.embeddings = embeddings
+        self.body_share = body_share
+        self.summary_share = summary_share
+        self.comments_share = comments_share
+        self.max_comment_tokens = max_comment_tokens
+        self.max_doc_tokens = max_doc_tokens
+        self.min_doc_tokens = min_doc_tokens
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+
+    @staticmethod
+    def _comment_text(comment) -> str:
+        if isinstance(comment, dict):
+            return str(comment.get("body") or "")
+        return str(comment or "")
+
+    def _mmr_order(self, query: str, docs: list) -> list:
+        """按 MMR 排序并去掉近重复文本块；无向量模型时只去掉完全相同的文本"""
+        if self.embeddings is None or len(docs) <= 1:
+            seen, unique = set(), []
+            for doc in docs:
+                if doc.page_content not in seen:
+                    seen.add(doc.page_content)
+                    unique.append(doc)
+            return unique
+
+        vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query_vec = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        query_vec /= max(float(np.linalg.norm(query_vec)), 1e-12)
+        relevance = vectors @ query_vec
+        similarity = vectors @ vectors.T
+
+        selected: list[int] = []
+        remaining = list(range(len(docs)))
+        while remaining:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = int(np.argmax(scores))
+            index = remaining.pop(best)
+            if redundancy[best] < self.dedup_threshold:
+                selected.append(index)
+        return [docs[i] for i in selected]
+
+    def pack(self, title: str, body: str, comments: list, docs: list, reserved: int = 0, summary: str = "") -> dict:
+        """
+        返回 {"body", "summary", "comments", "docs", "tokens"}
+        - comments: 按时间顺序的最新评论（已截断）；docs: [(标题, 截断后的内容)]
+        - reserved: 预算中预留给系统提示词、模板等固定部分的 token 数
+        """
+        remaining = self.budget - reserved - self.counter.count(title)
+
+        body = self.counter.truncate(body or "", int(self.budget * self.body_share))
+        remaining -= self.counter.count(body)
+
+        summary = self.counter.truncate(summary or "", min(int(self.budget * self.summary_share), max(remaining, 0)))
+        remaining -= self.counter.count(summary)
+
+        # 评论从最新往前取，直到用完评论额度
+        comments_budget = min(int(self.budget * self.comments_share), max(remaining, 0))
+        packed_comments = []
+        for comment in reversed(comments or []):
+            text = self._comment_text(comment).strip()
+            if not text:
+                continue
+            text = self.counter.truncate(text, min(self.max_comment_tokens, comments_budget))
+            cost = self.counter.count(text)
+            if not text or cost > comments_budget:
+                break
+            packed_comments.append(text)
+            comments_budget -= cost
+            remaining -= cost
+        packed_comments.reverse()
+
+        packed_docs = []
+        for doc in self._mmr_order(f"{title}\n{body}", docs or []):
+            if remaining < self.min_doc_tokens:
+                break
+            doc_title = doc.metadata.get("title", "N/A")
+            content = self.counter.truncate(doc.page_content, min(self.max_doc_tokens, remaining - self.counter.count(doc_title)))
+            if not content:
+                break
+            packed_docs.append((doc_title, content))
+            remaining -= self.counter.count(doc_title) + self.counter.count(content)
+
+        return {
+            "body": body,
+            "summary": summary,
+            "comments": packed_comments,
+            "docs": packed_docs,
+            "tokens": self.budget - reserved - remaining,
+        }
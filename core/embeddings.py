@@ -0,0 +1,225 @@
+# core/embeddings.py
+import asyncio
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+
+class EmbeddingCache:
+    """
+    两级向量缓存
+    - 键：sha256(模型名 + 文本)
+    - 一级：进程内 LRU；二级：SQLite，向量以 float32 字节存储
+    """
+
+    def __init__(self, db_path: Optional[str] = "data/embedding_cache.db", memory_size: int = 4096):
+        self.memory_size = memory_size
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            if os.path.dirname(db_path):
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self.counters = {"hits": 0, "misses": 0}
+
+    def _remember(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            missing = [k for k in keys if k not in found]
+            if missing and self._conn is not None:
+                # SQLite 单条语句变量数有上限，分批查询
+                for i in range(0, len(missing), 500):
+                    part = missing[i:i + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                        self._remember(key, vector)
+                        found[key] = vector
+            self.counters["hits"] += len(found)
+            self.counters["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, list[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._conn is not None and items:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()],
+                )
+
+
+class MicroBatcher:
+    """
+    动态微批调度器
+    并发到达的单条查询在 max_wait_ms 内聚合，由后台线程一次前向计算完成，
+    CPU 上的吞吐随并发增长而不是保持不变。
+    """
+
+    def __init__(self, encode: Callable[[list[str]], list[list[float]]], max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="embedding-batcher", daemon=True)
+        self._thread.start()
+        self.counters = {"batches": 0, "items": 0}
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            texts = list(dict.fromkeys(text for text, _ in batch))  # 同批重复文本只算一次
+            try:
+                vectors = dict(zip(texts, self._encode(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.counters["batches"] += 1
+            self.counters["items"] += len(batch)
+            for text, future in batch:
+                future.set_result(vectors[text])
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def load_sentence_transformer(
+    model_name: str,
+    backend: str = "torch",
+    onnx_dir: Optional[str] = None,
+    quantization: str = "avx2",
+) -> SentenceTransformer:
+    """
+    按推理后端加载模型
+    - torch: 原始 PyTorch 模型
+    - onnx: ONNX Runtime 推理（首次加载时自动导出），需安装 sentence-transformers[onnx]
+    - onnx-int8: 动态量化的 int8 ONNX 模型，首次使用时导出并缓存到 onnx_dir
+      quantization 取值见 sentence_transformers.export_dynamic_quantized_onnx_model（arm64/avx2/avx512/avx512_vnni）
+    """
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        local_dir = onnx_dir or os.path.join("data/onnx", model_name.replace("/", "__"))
+        file_name = f"onnx/model_qint8_{quantization}.onnx"
+        if not os.path.exists(os.path.join(local_dir, file_name)):
+            print(f"⚙️ 导出 int8 量化 ONNX 模型到 {local_dir}（仅首次）")
+            model = SentenceTransformer(model_name, backend="onnx")
+            model.save_pretrained(local_dir)
+            export_dynamic_quantized_onnx_model(model, quantization, local_dir)
+        return SentenceTransformer(local_dir, backend="onnx", model_kwargs={"file_name": file_name})
+    raise ValueError(f"未知的向量推理后端: {backend}，可选值: {BACKENDS}")
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    本地 SentenceTransformer 向量模型
+    - 向量缓存：相同文本（如同一 Issue 的多次评论事件）不重复计算
+    - 微批：并发的 embed_query 调用自动合并为一次批量编码
+    - backend: 推理后端（torch / onnx / onnx-int8），CPU 部署推荐 onnx 系列，
+      可用 scripts/embedding_bench.py 校验向量一致性并对比性能
+    """
+
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-small-zh",
+        cache_path: Optional[str] = "data/embedding_cache.db",
+        memory_cache_size: int = 4096,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        backend: str = "torch",
+        onnx_dir: Optional[str] = None,
+        quantization: str = "avx2",
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.model = load_sentence_transformer(model_name, backend, onnx_dir, quantization)
+        # 不同后端的向量存在细微差异，缓存按后端隔离
+        self._namespace = model_name if backend == "torch" else f"{model_name}@{backend}"
+        self.cache = EmbeddingCache(cache_path, memory_cache_size)
+        self.batcher = MicroBatcher(self._encode, max_batch_size, max_wait_ms)
+
+    def _encode(self, texts: list[str]) -> list[list[float]]:
+        return self.model.encode(texts).tolist()  # 转为 list
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self._namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_query(self, text: str):
+        key = self._key(text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = self.batcher.submit(text).result()
+        self.cache.put_many({key: vector})
+        return vector
+
+    async def aembed_query(self, text: str):
+        key = self._key(text)
+        cached = await asyncio.to_thread(self.cache.get_many, [key])
+        if key in cached:
+            return cached[key]
+        vector = await asyncio.wrap_future(self.batcher.submit(text))
+        await asyncio.to_thread(self.cache.put_many, {key: vector})
+        return vector
+
+    def embed_documents(self, texts: list[str]):
+        keys = [self._key(t) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in cached))
+        if missing:
+            computed = dict(zip(missing, self._encode(missing)))
+            self.cache.put_many({self._key(t): v for t, v in computed.items()})
+            cached.update({self._key(t): v for t, v in computed.items()})
+        return [cached[k] for k in keys]
+
+    def stats(self) -> dict:
+        batches = self.batcher.counters["batches"]
+        return {
+            "cache": self.cache.counters,
+            "batches": batches,
+            "avg_batch_size": round(self.batcher.counters["items"] / batches, 2) if batches else None,
+        }
@@ -0,0 +1,216 @@
+# core/github_client.py
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Optional
+
+import httpx
+
+
+class GitHubClient:
+    """
+    共享的异步 GitHub REST 客户端
+    - 复用连接池（httpx.AsyncClient），避免每次请求重新建立 TLS 连接
+    - 按 Link 头自动翻页
+    - ETag / If-None-Match 条件请求：内容未变时 GitHub 返回 304，不消耗速率配额
+    - Issue 评论按 since= 增量拉取，并与本地缓存合并
+    - graphql(): GraphQL 查询，跟踪剩余速率配额，配额不足时异步等待重置，不阻塞其他协程
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        base_url: str = "https://api.github.com",
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        max_cache_entries: int = 2000,
+        graphql_url: Optional[str] = None,
+        min_rate_budget: int = 50,
+    ):
+        token = token or os.getenv("GITHUB_TOKEN")
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if token:
+            headers["Authorization"] = f"token {token}"
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self.max_cache_entries = max_cache_entries
+        # url(含查询参数) -> (etag, 响应数据, 下一页 URL)
+        self._etags: OrderedDict[str, tuple[str, Any, Optional[str]]] = OrderedDict()
+        # repo#number -> {"since": 最近一次更新时间, "comments": {comment_id: comment}}
+        self._comments: OrderedDict[str, dict] = OrderedDict()
+        self.graphql_url = graphql_url or f"{base_url.rstrip('/')}/graphql"
+        self.min_rate_budget = min_rate_budget
+        # GraphQL 速率配额：剩余点数与重置时间（epoch 秒），首次请求前未知
+        self.rate_limit: dict[str, Optional[float]] = {"remaining": None, "reset_at": None}
+        self._rate_lock = asyncio.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "graphql_requests": 0, "graphql_cost": 0, "rate_waits": 0}
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: str, value, limit: int):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    async def _get(self, url: str, params: Optional[dict] = None) -> tuple[Any, Optional[str]]:
+        """条件 GET，返回 (数据, 下一页 URL)；304 时返回缓存数据"""
+        request = self._client.build_request("GET", url, params=params)
+        cache_key = str(request.url)
+        cached = self._etags.get(cache_key)
+        if cached:
+            request.headers["If-None-Match"] = cached[0]
+
+        resp = await self._client.send(request)
+        self.stats["requests"] += 1
+
+        if resp.status_code == 304 and cached:
+            self.stats["not_modified"] += 1
+            self._etags.move_to_end(cache_key)
+            return cached[1], cached[2]
+
+        resp.raise_for_status()
+        data = resp.json()
+        next_url = resp.links.get("next", {}).get("url")
+        etag = resp.headers.get("ETag")
+        if etag:
+            self._remember(self._etags, cache_key, (etag, data, next_url), self.max_cache_entries)
+        return data, next_url
+
+    async def paginate(self, url: str, params: Optional[dict] = None) -> list:
+        """按 Link 头依次拉取所有分页并合并结果"""
+        items = []
+        data, next_url = await self._get(url, params=params)
+        items.extend(data)
+        while next_url:
+            data, next_url = await self._get(next_url)
+            items.extend(data)
+        return items
+
+    async def get_issue_comments(self, repo_full_name: str, issue_number: int) -> list[dict]:
+        """
+        拉取 Issue 的全部评论（按创建顺序）
+        - 首次全量拉取，之后只拉取 since 之后更新过的评论并与缓存合并
+        - 注意：增量模式下无法感知被删除的评论
+        """
+        key = f"{repo_full_name}#{issue_number}"
+        entry = self._comments.get(key) or {"since": None, "comments": {}}
+
+        params = {"per_page": 100}
+        if entry["since"]:
+            params["since"] = entry["since"]
+        fetched = await self.paginate(f"/repos/{repo_full_name}/issues/{issue_number}/comments", params=params)
+
+        comments = dict(entry["comments"])
+        for c in fetched:
+            comments[c["id"]] = c
+        since = max((c.get("updated_at") or "" for c in comments.values()), default="") or None
+
+        self._remember(self._comments, key, {"since": since, "comments": comments}, self.max_cache_entries)
+        return sorted(comments.values(), key=lambda c: (c.get("created_at") or "", c["id"]))
+
+    async def get_many_issue_comments(self, issues: list[tuple[str, int]]) -> list[list[dict]]:
+        """并发拉取多个 Issue 的评论，共享同一个连接池"""
+        return await asyncio.gather(*(self.get_issue_comments(repo, number) for repo, number in issues))
+
+    async def _wait_for_rate_budget(self):
+        """剩余配额低于 min_rate_budget 时等待到重置时间；并发调用共用一次等待"""
+        async with self._rate_lock:
+            remaining, reset_at = self.rate_limit["remaining"], self.rate_limit["reset_at"]
+            if remaining is None or reset_at is None or remaining >= self.min_rate_budget:
+                return
+            delay = reset_at - time.time() + 1
+            if delay > 0:
+                self.stats["rate_waits"] += 1
+                print(f"🚦 GraphQL 配额剩余 {int(remaining)}，等待 {int(delay)} 秒后继续")
+                await asyncio.sleep(delay)
+            self.rate_limit["remaining"] = None
+
+    def _update_rate_limit(self, resp: httpx.Response, data: dict):
+        """优先使用查询中的 rateLimit 字段，其次使用响应头"""
+        info = (data.get("data") or {}).get("rateLimit") or {}
+        if info:
+            self.stats["graphql_cost"] += info.get("cost") or 0
+            self.rate_limit["remaining"] = info.get("remaining")
+            if info.get("resetAt"):
+                self.rate_limit["reset_at"] = datetime.fromisoformat(info["resetAt"].replace("Z", "+00:00")).timestamp()
+        elif "x-ratelimit-remaining" in resp.headers:
+            self.rate_limit["remaining"] = int(resp.headers["x-ratelimit-remaining"])
+            self.rate_limit["reset_at"] = float(resp.headers.get("x-ratelimit-reset") or time.time())
+
+    async def graphql(self, query: str, variables: Optional[dict] = None, max_retries: int = 3) -> dict:
+        """
+        执行 GraphQL 查询并返回 data
+        - 查询中带上 rateLimit { cost remaining resetAt } 即可精确跟踪配额
+        - 触发限流时按 Retry-After 或重置时间异步等待后重试：包括 429、确认为限流的 403（见 _is_rate_limited），
+          以及 HTTP 200 但 errors 中带 RATE_LIMITED、或配额已耗尽（x-ratelimit-remaining: 0）的响应
+        - 权限、SSO 等其他 403 直接抛出，不等待重试
+        """
+        for attempt in range(max_retries + 1):
+            await self._wait_for_rate_budget()
+            resp = await self._client.post(self.graphql_url, json={"query": query, "variables": variables or {}})
+            self.stats["requests"] += 1
+            self.stats["graphql_requests"] += 1
+
+            if self._is_rate_limited(resp):
+                if attempt >= max_retries:
+                    break
+                await self._rate_limited_sleep(resp, attempt)
+                continue
+
+            resp.raise_for_status()
+            data = resp.json()
+            self._update_rate_limit(resp, data)
+            errors = data.get("errors")
+            if errors:
+                rate_limited = any(isinstance(e, dict) and e.get("type") == "RATE_LIMITED" for e in errors)
+                if rate_limited or resp.headers.get("x-ratelimit-remaining") == "0":
+                    if attempt >= max_retries:
+                        break
+                    await self._rate_limited_sleep(resp, attempt, exhausted=True)
+                    continue
+                raise RuntimeError(f"GraphQL 查询失败: {errors}")
+            return data["data"]
+        raise RuntimeError("GraphQL 查询多次触发限流，已放弃")
+
+    @staticmethod
+    def _is_rate_limited(resp: httpx.Response) -> bool:
+        """
+        429 一律视为限流；GitHub 的每个响应都带 x-ratelimit-reset，403 只有以下情况才是限流：
+        带 Retry-After、配额已耗尽（x-ratelimit-remaining: 0），或响应正文说明触发了（二级）限流
+        """
+        if resp.status_code == 429:
+            return True
+        if resp.status_code != 403:
+            return False
+        if resp.headers.get("retry-after") or resp.headers.get("x-ratelimit-remaining") == "0":
+            return True
+        return "rate limit" in resp.text.lower()
+
+    async def _rate_limited_sleep(self, resp: httpx.Response, attempt: int, exhausted: bool = False):
+        """
+        按 Retry-After、配额重置时间或指数退避等待
+        只有主配额耗尽（exhausted 或 x-ratelimit-remaining: 0）才等到重置时间，二级限流按退避重试
+        """
+        retry_after = resp.headers.get("retry-after")
+        exhausted = exhausted or resp.headers.get("x-ratelimit-remaining") == "0"
+        reset_at = resp.headers.get("x-ratelimit-reset") or self.rate_limit["reset_at"]
+        if retry_after:
+            delay = float(retry_after)
+        elif exhausted and reset_at is not None:
+            delay = float(reset_at) - time.time() + 1
+        else:
+            delay = 2 ** attempt * 5
+        delay = max(delay, 1)
+        self.stats["rate_waits"] += 1
+        print(f"🚦 GraphQL 触发限流，等待 {int(delay)} 秒后重试")
+        await asyncio.sleep(delay)
+        self.rate_limit["remaining"] = None  # 已等到重置，避免 _wait_for_rate_budget 再等一次
+
+    async def aclose(self):
+        await self._client.aclose()
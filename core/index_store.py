@@ -0,0 +1,110 @@
+# core/index_store.py
+import os
+import shutil
+import time
+from typing import Optional
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+# 各服务进程正在使用的版本，每个进程一个文件（文件名为 pid）
+SERVED_DIR = "served"
+
+
+def current_version(root: str) -> Optional[str]:
+    """读取 root/CURRENT 指向的版本名，不存在时返回 None（旧版单目录布局）"""
+    path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def resolve_index_dir(root: str, version: Optional[str] = None) -> str:
+    """
+    返回实际的索引目录
+    - 版本化布局：root/versions/<version>
+    - 旧版布局（无 CURRENT）：root 本身
+    """
+    version = version or current_version(root)
+    if version is None:
+        return root
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def list_versions(root: str) -> list[str]:
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(v for v in os.listdir(versions_dir) if not v.startswith("."))
+
+
+def stage_version(root: str) -> tuple[str, str]:
+    """
+    新建一个待发布的版本目录，并拷贝当前版本的内容作为增量构建的基础
+    版本名以时间戳开头，按名称排序即为发布顺序；服务端读取的目录在构建期间不会被修改
+    """
+    now = time.time()
+    version = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1e6) % 1000000:06d}"
+    path = os.path.join(root, VERSIONS_DIR, version)
+    base = resolve_index_dir(root)
+    if os.path.isdir(base) and os.listdir(base):
+        ignore = shutil.ignore_patterns(VERSIONS_DIR, SERVED_DIR, CURRENT_FILE, CURRENT_FILE + ".tmp", "*.tmp", "*.raw")
+        shutil.copytree(base, path, ignore=ignore)
+    else:
+        os.makedirs(path)
+    return version, path
+
+
+def publish_version(root: str, version: str):
+    """原子切换 CURRENT 指针：先写临时文件并落盘，再 os.replace"""
+    path = os.path.join(root, CURRENT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def mark_served(root: str, versions: list[str]):
+    """记录本进程正在使用的版本（含热加载时尚在收尾的旧版本），prune_versions 不会删除它们"""
+    path = os.path.join(root, SERVED_DIR)
+    os.makedirs(path, exist_ok=True)
+    marker = os.path.join(path, str(os.getpid()))
+    with open(marker + ".tmp", "w", encoding="utf-8") as f:
+        f.write("\n".join(v for v in versions if v))
+    os.replace(marker + ".tmp", marker)
+
+
+def served_versions(root: str) -> set[str]:
+    """仍在运行的服务进程正在使用的版本；已退出进程留下的记录顺带删除"""
+    path = os.path.join(root, SERVED_DIR)
+    if not os.path.isdir(path):
+        return set()
+    served = set()
+    for name in os.listdir(path):
+        if not name.isdigit():
+            continue
+        try:
+            os.kill(int(name), 0)
+        except ProcessLookupError:
+            os.remove(os.path.join(path, name))
+            continue
+        except PermissionError:
+            pass  # 进程存在但属于其他用户
+        with open(os.path.join(path, name), "r", encoding="utf-8") as f:
+            served.update(line.strip() for line in f if line.strip())
+    return served
+
+
+def prune_versions(root: str, keep: int = 3) -> list[str]:
+    """
+    删除旧版本，保留最近 keep 个、当前版本及服务进程正在使用的版本
+    保留多个版本，使仍在旧版本上执行的检索与回滚都不受影响；
+    两次热加载检查之间连续发布多个版本时，服务中的版本也不会被删除
+    """
+    pinned = {current_version(root)} | served_versions(root)
+    versions = list_versions(root)
+    removed = [v for v in versions[:-keep] if v not in pinned] if keep > 0 else []
+    for version in removed:
+        shutil.rmtree(os.path.join(root, VERSIONS_DIR, version), ignore_errors=True)
+    return removed
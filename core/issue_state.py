@@ -4,11 +4,15 @@ from langchain_core.documents import Document
 
 
 class IssueState(TypedDict):
+    repo_full_name: str
     issue_url: str
+    issue_id: str
     issue_number: int
     issue_title: str
     issue_body: str
     comments: List[str]
+    thread_summary: Optional[str]
+    recent_comments: Optional[List[str]]
     need_reply: bool
     retrieved_docs: Optional[List[Document]]
     reply_text: Optional[str]
@@ -0,0 +1,265 @@
+# core/job_queue.py
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+
+class QueueFullError(RuntimeError):
+    """队列积压超过上限时抛出，调用方据此做背压（如返回 503）"""
+
+
+class JobQueue:
+    """
+    基于 SQLite 的持久化任务队列
+    - 任务先落盘再处理，进程重启后未完成的任务会被重新执行
+    - 固定数量的 worker 并发消费，限制对下游 LLM 的并发压力
+    - 失败任务按指数退避重试，超过最大次数后标记为 failed
+    - stats() 报告队列深度与最老任务等待时长
+    - 带 key 的任务支持防抖合并：同一 key 的待处理任务只保留最新一份 payload，
+      新事件到来时会取消该 key 正在执行的任务，由合并后的新任务接替
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        db_path: str = "data/jobs.db",
+        workers: int = 4,
+        max_attempts: int = 3,
+        backoff_base: float = 5.0,
+        backoff_max: float = 300.0,
+        poll_interval: float = 1.0,
+        max_depth: Optional[int] = None,
+    ):
+        self.handler = handler
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.max_depth = max_depth
+
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._wakeup: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._running: dict[str, tuple[int, asyncio.Task]] = {}  # key -> (job_id, 执行中的任务)
+        self._superseded: set[int] = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                last_error TEXT,
+                job_key TEXT
+            )
+            """
+        )
+        # 兼容旧版本数据库
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "job_key" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN job_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, available_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (job_key, status)")
+        return conn
+
+    # ------------------------------------------------------------------
+    # 同步 SQLite 操作（在线程中执行，避免阻塞事件循环）
+    # ------------------------------------------------------------------
+    def _insert(self, payload: dict, key: Optional[str] = None, delay: float = 0.0) -> tuple[int, bool]:
+        """写入任务，返回 (job_id, 是否与已有待处理任务合并)"""
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            if key is not None:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE job_key = ? AND status = 'pending' ORDER BY id LIMIT 1",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    # 合并：以最新事件为准，并重新开始防抖计时
+                    self._conn.execute(
+                        "UPDATE jobs SET payload = ?, available_at = ?, updated_at = ? WHERE id = ?",
+                        (data, now + delay, now, row[0]),
+                    )
+                    return row[0], True
+            if self.max_depth is not None:
+                (depth,) = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'pending'"
+                ).fetchone()
+                if depth >= self.max_depth:
+                    raise QueueFullError(f"任务队列已满：{depth} 个待处理任务（上限 {self.max_depth}）")
+            cur = self._conn.execute(
+                "INSERT INTO jobs (payload, available_at, created_at, updated_at, job_key) VALUES (?, ?, ?, ?, ?)",
+                (data, now + delay, now, now, key),
+            )
+            return cur.lastrowid, False
+
+    def _claim(self) -> Optional[tuple[int, dict, int, Optional[str]]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts, job_key FROM jobs "
+                    "WHERE status = 'pending' AND available_at <= ? "
+                    "ORDER BY available_at, id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[0], json.loads(row[1]), row[2] + 1, row[3]
+
+    def _complete(self, job_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def _fail(self, job_id: int, attempts: int, error: str):
+        now = time.time()
+        with self._lock:
+            if attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+            else:
+                delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+                delay *= random.uniform(0.8, 1.2)  # 抖动，避免同时重试
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'pending', available_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (now + delay, error, now, job_id),
+                )
+
+    def _recover(self) -> int:
+        """进程重启后，将上次异常退出时仍处于 running 的任务放回队列"""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'pending', updated_at = ? WHERE status = 'running'",
+                (time.time(),),
+            )
+            return cur.rowcount
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*), MIN(created_at) FROM jobs GROUP BY status"
+            ).fetchall()
+            (ready,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'pending' AND available_at <= ?", (now,)
+            ).fetchone()
+        by_status = {status: (count, oldest) for status, count, oldest in rows}
+        pending, oldest_pending = by_status.get("pending", (0, None))
+        return {
+            "depth": pending,
+            "ready": ready,
+            "running": by_status.get("running", (0, None))[0],
+            "failed": by_status.get("failed", (0, None))[0],
+            "oldest_age_seconds": round(now - oldest_pending, 1) if oldest_pending else 0.0,
+            "workers": self.workers,
+        }
+
+    # ------------------------------------------------------------------
+    # 异步接口
+    # ------------------------------------------------------------------
+    async def enqueue(self, payload: dict, key: Optional[str] = None, delay: float = 0.0) -> int:
+        """
+        写入一个任务并唤醒空闲 worker，队列已满时抛出 QueueFullError
+        - key: 合并键（如 repo#issue_number），同一 key 的事件会被合并为一次执行
+        - delay: 防抖窗口（秒），窗口内的后续事件会重新计时
+        """
+        job_id, merged = await asyncio.to_thread(self._insert, payload, key, delay)
+        if merged:
+            print(f"🧲 事件已合并到待处理任务 {job_id} ({key})")
+        if key is not None:
+            self._cancel_running(key)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def _cancel_running(self, key: str):
+        """取消该 key 正在执行的旧任务，由新任务基于最新状态重新处理"""
+        running = self._running.get(key)
+        if running is None:
+            return
+        job_id, task = running
+        if not task.done():
+            print(f"🛑 取消过期任务 {job_id} ({key})")
+            self._superseded.add(job_id)
+            task.cancel()
+
+    async def start(self):
+        recovered = await asyncio.to_thread(self._recover)
+        if recovered:
+            print(f"♻️ 恢复 {recovered} 个未完成任务")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"🧵 任务队列已启动，worker 数量: {self.workers}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        with self._lock:
+            self._conn.close()
+
+    async def _worker(self, index: int):
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, payload, attempts, key = job
+            task = asyncio.create_task(self.handler(payload))
+            if key is not None:
+                self._running[key] = (job_id, task)
+            try:
+                await task
+            except asyncio.CancelledError:
+                if job_id in self._superseded:
+                    # 被同一 key 的新事件取代，直接丢弃
+                    self._superseded.discard(job_id)
+                    await asyncio.to_thread(self._complete, job_id)
+                    continue
+                # 服务关闭：任务保持 running，下次启动时由 _recover 放回队列
+                task.cancel()
+                raise
+            except Exception as e:
+                print(f"⚠️ 任务 {job_id} 第 {attempts} 次执行失败: {e}")
+                await asyncio.to_thread(self._fail, job_id, attempts, str(e))
+            else:
+                await asyncio.to_thread(self._complete, job_id)
+            finally:
+                if key is not None and self._running.get(key, (None,))[0] == job_id:
+                    del self._running[key]
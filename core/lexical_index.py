@@ -0,0 +1,196 @@
+# core/lexical_index.py
+import json
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+BM25_ARRAYS_FILE = "bm25.npz"
+BM25_VOCAB_FILE = "bm25_vocab.json"
+BM25_DOCS_FILE = "bm25_docs.jsonl"
+
+# ASCII 词：保留版本号、配置键、报错串中的 . _ - / : 等连接符
+_ASCII_RE = re.compile(r"[a-z0-9_](?:[a-z0-9_.\-/:]*[a-z0-9_])?")
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+_SPLIT_RE = re.compile(r"[._\-/:]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    中英文混合分词，无需外部分词器
+    - 中文：字的 unigram + bigram
+    - 英文/数字：完整词（如 v1.2.3、max_body_size）及其按连接符拆开的子词
+    """
+    text = text.lower()
+    tokens = []
+    for word in _ASCII_RE.findall(text):
+        tokens.append(word)
+        parts = [p for p in _SPLIT_RE.split(word) if p]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int = 60, top_n: Optional[int] = None) -> list[Document]:
+    """按 RRF 融合多路排序结果，以文本内容识别同一文档"""
+    scores: dict[str, float] = {}
+    docs: dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ordered[:top_n]]
+
+
+def _add_postings(postings: dict[str, list[tuple[int, int]]], doc_id: int, text: str) -> int:
+    """将一篇文档的词频加入倒排表，返回文档长度"""
+    counter = Counter(tokenize(text))
+    for term, tf in counter.items():
+        postings.setdefault(term, []).append((doc_id, tf))
+    return sum(counter.values())
+
+
+def _weighted_csr(postings: dict[str, list[tuple[int, int]]], doc_len: list[int], k1: float, b: float):
+    """倒排表转为 CSR 数组，并预先算好每个 posting 的 BM25 权重"""
+    n = len(doc_len)
+    doc_len = np.asarray(doc_len, dtype=np.float32)
+    avgdl = float(doc_len.mean()) if n else 1.0
+
+    vocab = {term: i for i, term in enumerate(postings)}
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    doc_ids, weights = [], []
+    for i, plist in enumerate(postings.values()):
+        ids = np.array([d for d, _ in plist], dtype=np.int32)
+        tf = np.array([t for _, t in plist], dtype=np.float32)
+        idf = np.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        norm = tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len[ids] / max(avgdl, 1e-6)))
+        doc_ids.append(ids)
+        weights.append((idf * norm).astype(np.float32))
+        indptr[i + 1] = indptr[i] + len(plist)
+
+    return (
+        vocab,
+        indptr,
+        np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32),
+        np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+    )
+
+
+class BM25Index:
+    """
+    内存 BM25 倒排索引
+    - 倒排表以 CSR 形式存储（indptr / doc_ids / weights），构建时即算好每个 posting 的 BM25 权重，
+      查询只需按词取出 posting 累加，无逐文档计算
+    - 数组存为 .npz，词表为 JSON，加载快且体积小
+    """
+
+    def __init__(self, vocab: dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray, docs: list[Document]):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.docs = docs
+
+    @classmethod
+    def build(cls, texts: list[str], metadatas: list[dict], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_len = []
+        for doc_id, text in enumerate(texts):
+            doc_len.append(_add_postings(postings, doc_id, text))
+        vocab, indptr, doc_ids, weights = _weighted_csr(postings, doc_len, k1, b)
+        docs = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        return cls(vocab, indptr, doc_ids, weights, docs)
+
+    def save(self, persist_dir: str):
+        writer = BM25Writer(persist_dir)
+        for doc in self.docs:
+            writer.write_doc(doc.page_content, doc.metadata)
+        writer.finish(self.vocab, self.indptr, self.doc_ids, self.weights)
+
+    @classmethod
+    def exists(cls, persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, BM25_ARRAYS_FILE))
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "BM25Index":
+        arrays = np.load(os.path.join(persist_dir, BM25_ARRAYS_FILE))
+        with open(os.path.join(persist_dir, BM25_VOCAB_FILE), "r", encoding="utf-8") as f:
+            vocab = {term: i for i, term in enumerate(json.load(f))}
+        docs = []
+        with open(os.path.join(persist_dir, BM25_DOCS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                docs.append(Document(page_content=record["page_content"], metadata=record["metadata"]))
+        return cls(vocab, arrays["indptr"], arrays["doc_ids"], arrays["weights"], docs)
+
+    def search_with_score(self, query: str, k: int = 5) -> list[tuple[Document, float]]:
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # 同一词的 posting 中文档不重复，可直接按下标累加
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        hits = np.flatnonzero(scores)
+        if len(hits) == 0:
+            return []
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.docs[i], float(scores[i])) for i in top]
+
+    def search(self, query: str, k: int = 5) -> list[Document]:
+        return [doc for doc, _ in self.search_with_score(query, k)]
+
+
+class BM25Writer:
+    """
+    流式构建 BM25 索引：文档逐条加入并直接写入磁盘，内存中只保留倒排表
+    所有文件先写临时文件，commit 时原子替换，中途失败不影响已有索引
+    """
+
+    def __init__(self, persist_dir: str, k1: float = 1.5, b: float = 0.75):
+        os.makedirs(persist_dir, exist_ok=True)
+        self.persist_dir = persist_dir
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.doc_len: list[int] = []
+        self._docs_tmp = os.path.join(persist_dir, BM25_DOCS_FILE + ".tmp")
+        self._docs = open(self._docs_tmp, "w", encoding="utf-8")
+
+    def write_doc(self, text: str, metadata: dict):
+        self._docs.write(json.dumps({"page_content": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+
+    def add(self, text: str, metadata: dict):
+        self.doc_len.append(_add_postings(self.postings, len(self.doc_len), text))
+        self.write_doc(text, metadata)
+
+    def commit(self):
+        self.finish(*_weighted_csr(self.postings, self.doc_len, self.k1, self.b))
+
+    def finish(self, vocab: dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray):
+        self._docs.close()
+        arrays_tmp = os.path.join(self.persist_dir, "bm25.tmp.npz")
+        np.savez(arrays_tmp, indptr=indptr, doc_ids=doc_ids, weights=weights)
+        vocab_tmp = os.path.join(self.persist_dir, BM25_VOCAB_FILE + ".tmp")
+        with open(vocab_tmp, "w", encoding="utf-8") as f:
+            json.dump(list(vocab), f, ensure_ascii=False)
+        os.replace(vocab_tmp, os.path.join(self.persist_dir, BM25_VOCAB_FILE))
+        os.replace(self._docs_tmp, os.path.join(self.persist_dir, BM25_DOCS_FILE))
+        os.replace(arrays_tmp, os.path.join(self.persist_dir, BM25_ARRAYS_FILE))
+
+    def abort(self):
+        self._docs.close()
+        if os.path.exists(self._docs_tmp):
+            os.remove(self._docs_tmp)
@@ -3,20 +3,26 @@ import os
 
 from sympy import im
 import dotenv
+from core.llm_cache import get_llm_cache
 dotenv.load_dotenv(".env")
 
-def get_llm(model_name: str = "deepseek-chat", temperature: float = 0.3):
+def get_llm(model_name: str = "deepseek-chat", temperature: float = 0.3, cache: bool | None = None):
     """
     返回一个可复用的 DeepSeek LLM 实例。
+    - cache: 是否启用响应缓存（core.llm_cache），默认读取环境变量 LLM_CACHE（默认开启）
     """
     api_key = os.getenv("OPENAI_API_KEY")
     base_url = os.getenv("OPENAI_API_BASE", "https://api.deepseek.com/v1")
+    if cache is None:
+        cache = os.getenv("LLM_CACHE", "1") != "0"
 
     llm = ChatOpenAI(
         model=model_name,
         openai_api_key=api_key,
         openai_api_base=base_url,
         temperature=temperature,
+        # False 显式关闭缓存；None 会回退到 langchain 的全局缓存
+        cache=get_llm_cache() if cache else False,
     )
     return llm
 
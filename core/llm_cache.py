@@ -0,0 +1,150 @@
+# core/llm_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+
+class TieredLLMCache(BaseCache):
+    """
+    按内容寻址的两级 LLM 响应缓存
+    - 键：sha256(llm_string + prompt)，llm_string 已包含模型名、温度等参数，prompt 为序列化后的消息
+    - 一级：进程内 LRU；二级：SQLite 磁盘缓存，进程重启后依然命中
+    - 两级均支持 TTL 过期，磁盘层按条目数上限淘汰最旧记录
+    - stats() 报告各层命中与未命中次数
+    """
+
+    def __init__(
+        self,
+        db_path: str = "data/llm_cache.db",
+        memory_size: int = 1024,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_disk_entries: int = 100_000,
+    ):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, tuple[float, RETURN_VAL_TYPE]] = OrderedDict()
+        self._conn = self._connect()
+        self._writes = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache (created_at)")
+        return conn
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, created_at: float, value: RETURN_VAL_TYPE):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                if not self._expired(cached[0]):
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return cached[1]
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and not self._expired(row[1]):
+                value = [loads(g) for g in json.loads(row[0])]
+                self._remember(key, row[1], value)
+                self.counters["disk_hits"] += 1
+                return value
+
+            self.counters["misses"] += 1
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        value = json.dumps([dumps(g) for g in return_val], ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, return_val)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+
+    def _evict(self):
+        """删除过期记录，并在超出条目上限时淘汰最旧记录"""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_disk_entries:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY created_at LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        total = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / total, 3) if total else None,
+            "memory_entries": len(self._memory),
+        }
+
+
+_cache: Optional[TieredLLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> TieredLLMCache:
+    """返回进程内唯一的 LLM 缓存（懒创建），路径与 TTL 可通过环境变量配置"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TieredLLMCache(
+                    db_path=os.getenv("LLM_CACHE_DB", "data/llm_cache.db"),
+                    ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+                )
+    return _cache
@@ -0,0 +1,232 @@
+# core/mcp_session_pool.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, Awaitable, Callable, Optional
+
+
+class PersistentSession:
+    """
+    单个长连接会话
+    MCP 的 stdio 客户端基于 anyio 任务组，必须在同一个任务内进入和退出，
+    因此每个会话由一个专属的后台任务持有，关闭时通知该任务自行退出。
+    """
+
+    def __init__(self, factory: Callable[[], AsyncContextManager], index: int | str):
+        self._factory = factory
+        self.index = index
+        self.app = None
+        self.error: Optional[str] = None
+        self.opened_at: Optional[float] = None
+        self.reconnects = 0
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+
+    @property
+    def alive(self) -> bool:
+        return self.app is not None and self._task is not None and not self._task.done()
+
+    async def open(self, timeout: float):
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self.error = None
+        self._task = asyncio.create_task(self._hold())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.error = f"会话启动超时（{timeout}s）"
+            await self.close()
+        except BaseException:
+            # 外层取消（如 wait_for 超时）时结束持有任务，避免子进程泄漏
+            await self.close()
+            raise
+        if not self.alive:
+            raise RuntimeError(f"MCP 会话 {self.index} 启动失败: {self.error}")
+        self.opened_at = time.time()
+
+    async def _hold(self):
+        try:
+            async with self._factory() as app:
+                self.app = app
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.app = None
+            self._ready.set()
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._closing.set()
+        if not self._ready.is_set():
+            self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self.app = None
+
+
+async def list_tools_ping(app):
+    """
+    默认健康检查：通过会话列出工具，确认 MCP server 子进程仍能响应
+    - fast-agent 的 AgentApp 先取默认 Agent，再调用其 list_tools()
+    """
+    agent = app._agent(None) if hasattr(app, "_agent") else app
+    await agent.list_tools()
+
+
+class MCPSessionPool:
+    """
+    长连接 MCP Agent 会话池
+    - 服务启动时打开会话（拉起 MCP server 子进程），之后各 Issue 复用，不再逐次启停
+    - 会话数即并发上限，超出的请求排队等待空闲会话
+    - 后台定期健康检查，子进程崩溃或调用异常后自动重连
+    - factory: 返回异步上下文管理器的工厂，如 fast.run；每个会话调用一次
+    - ping: 健康检查协程，参数为会话内的 app，默认 list_tools_ping；传 None 时只检查持有任务是否存活
+    - 至少一个会话通过首次健康检查后才视为已启动（started），调用方可用 wait_started() 限时等待
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], AsyncContextManager],
+        size: int = 1,
+        ping: Optional[Callable[[object], Awaitable]] = list_tools_ping,
+        health_interval: float = 30.0,
+        open_timeout: float = 120.0,
+        ping_timeout: float = 10.0,
+    ):
+        self.size = size
+        self.ping = ping
+        self.health_interval = health_interval
+        self.open_timeout = open_timeout
+        self.ping_timeout = ping_timeout
+        self._healthy = asyncio.Event()
+        self._sessions = [PersistentSession(factory, i) for i in range(size)]
+        self._idle: asyncio.Queue[PersistentSession] | None = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self._idle is not None and self._healthy.is_set()
+
+    async def wait_started(self, timeout: float):
+        """等待会话池通过首次健康检查，超时抛出 TimeoutError"""
+        try:
+            await asyncio.wait_for(self._healthy.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"MCP 会话池 {timeout}s 内未就绪: {self.status()}") from None
+
+    async def start(self):
+        """打开全部会话并启动健康检查；打开失败的会话会在下次使用或巡检时重试"""
+        self._idle = asyncio.Queue()
+        for session in self._sessions:
+            self._idle.put_nowait(session)
+        await self.check_health()
+        self._health_task = asyncio.create_task(self._health_loop())
+        if self.started:
+            print(f"🔌 MCP 会话池已启动: {self.status()}")
+        else:
+            print(f"⚠️ MCP 会话池首次健康检查未通过，后台巡检通过后启用: {self.status()}")
+
+    async def stop(self):
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+        await asyncio.gather(*(s.close() for s in self._sessions), return_exceptions=True)
+        self._idle = None
+        self._healthy.clear()
+
+    async def _reconnect(self, session: PersistentSession):
+        if session.opened_at is not None:
+            session.reconnects += 1
+            print(f"♻️ 重连 MCP 会话 {session.index}（原因: {session.error or '健康检查失败'}）")
+        await session.close()
+        await session.open(self.open_timeout)
+
+    async def _ping(self, session: PersistentSession) -> bool:
+        if not session.alive:
+            return False
+        if self.ping is None:
+            return True
+        try:
+            await asyncio.wait_for(self.ping(session.app), timeout=self.ping_timeout)
+            session.error = None
+            return True
+        except Exception as e:
+            session.error = f"健康检查失败: {e!r}"
+            return False
+
+    async def _ensure(self, session: PersistentSession):
+        """检查会话是否可用，不可用则重连，重连后再检查一次"""
+        if await self._ping(session):
+            return
+        await self._reconnect(session)
+        if not await self._ping(session):
+            raise RuntimeError(f"MCP 会话 {session.index} 重连后健康检查仍未通过: {session.error}")
+
+    async def check_health(self) -> int:
+        """逐个取出空闲会话做检查，避免与正在处理的请求冲突；返回通过检查的会话数"""
+        healthy = 0
+        for _ in range(self.size):
+            session = await self._idle.get()
+            try:
+                await self._ensure(session)
+                healthy += 1
+            except Exception as e:
+                print(f"⚠️ {e}")
+            finally:
+                self._idle.put_nowait(session)
+        if healthy:
+            self._healthy.set()
+        return healthy
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        借用一个会话：池满时排队；调用异常时在归还前重连该会话
+        调用被取消（如任务被新事件取代）时 MCP 请求可能只完成一半，直接关闭会话，下次借用或巡检时重连
+        """
+        if not self.started:
+            raise RuntimeError("MCPSessionPool 尚未启动")
+        session = await self._idle.get()
+        try:
+            if not session.alive:
+                await self._reconnect(session)
+        except BaseException:
+            self._idle.put_nowait(session)
+            raise
+
+        failed = False
+        try:
+            yield session.app
+        except asyncio.CancelledError:
+            session.error = "调用被取消"
+            await session.close()
+            raise
+        except Exception as e:
+            failed = True
+            session.error = str(e)
+            raise
+        finally:
+            if failed:
+                try:
+                    await self._reconnect(session)
+                except Exception as e:
+                    print(f"⚠️ {e}")
+            self._idle.put_nowait(session)
+
+    def status(self) -> dict:
+        return {
+            "size": self.size,
+            "alive": sum(s.alive for s in self._sessions),
+            "idle": self._idle.qsize() if self._idle else 0,
+            "reconnects": sum(s.reconnects for s in self._sessions),
+            "errors": [s.error for s in self._sessions if s.error],
+        }
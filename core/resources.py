@@ -0,0 +1,269 @@
+# core/resources.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from core.index_store import current_version, mark_served, resolve_index_dir
+
+
+class ResourceRegistry:
+    """
+    进程级共享资源注册表
+    - LLM、Embedding 模型、向量库等重量级资源只创建一次，在各 Graph 节点间复用
+    - 服务启动时调用 warm_up() 预热，并通过 status() 对外报告就绪状态
+    - persist_dir 为索引根目录，支持版本化布局（CURRENT 指针），reload_retriever() 可在运行中切换版本
+    """
+
+    def __init__(
+        self,
+        model_name: str = "deepseek-chat",
+        temperature: float = 0.3,
+        persist_dir: str = "data/chroma_db",
+        embedding_model: str = "BAAI/bge-small-zh",
+        cpu_workers: int = 4,
+        embedding_backend: str | None = None,
+        rerank: bool | None = None,
+    ):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.persist_dir = persist_dir
+        self.embedding_model = embedding_model
+        self.embedding_backend = embedding_backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        # 交叉编码器重排（RERANK=1 开启），开启后检索阶段多取 rerank_candidates 条候选
+        self.rerank_enabled = os.getenv("RERANK", "0") == "1" if rerank is None else rerank
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "20"))
+
+        # CPU 密集任务（向量化、检索）专用线程池，避免占满事件循环默认线程池
+        self.executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="issue-cpu")
+
+        self._lock = threading.RLock()
+        self._llm = None
+        self._embeddings = None
+        self._retriever = None
+        self._classifier = None
+        self._pre_classifier = None
+        self._replier = None
+        self._reranker = None
+        self._summarizer = None
+        self._reload_lock = threading.Lock()
+        self.index_version = None
+
+        self.state = "cold"  # cold / warming / ready / failed
+        self.error = None
+        self.timings: dict[str, float] = {}
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    from core.llm import get_llm
+                    self._llm = get_llm(self.model_name, self.temperature)
+        return self._llm
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    from core.embeddings import LocalEmbeddings
+                    self._embeddings = LocalEmbeddings(
+                        model_name=self.embedding_model,
+                        backend=self.embedding_backend,
+                    )
+        return self._embeddings
+
+    @property
+    def retriever(self):
+        if self._retriever is None:
+            with self._lock:
+                if self._retriever is None:
+                    version = current_version(self.persist_dir)
+                    self._retriever = self._load_retriever(version)
+                    self.index_version = version
+                    self._mark_served(version)
+        return self._retriever
+
+    def _mark_served(self, *versions: str | None):
+        """记录正在使用的索引版本，避免构建端清理旧版本时删除；旧版单目录布局无需记录"""
+        if not any(versions):
+            return
+        try:
+            mark_served(self.persist_dir, list(versions))
+        except OSError as e:
+            print(f"⚠️ 记录服务中的索引版本失败: {e}")
+
+    def _load_retriever(self, version: str | None):
+        from agents.retriever_agent import RetrieverAgent
+        return RetrieverAgent(
+            persist_dir=resolve_index_dir(self.persist_dir, version),
+            model_name=self.embedding_model,
+            embeddings=self.embeddings,
+        )
+
+    @contextmanager
+    def lease_retriever(self):
+        """
+        取得当前检索器并在使用期间持有
+        取用与计数在同一把锁内完成，热加载的替换不会让正在使用的旧索引被提前释放
+        """
+        self.retriever  # 确保已创建
+        with self._lock:
+            retriever = self._retriever
+            retriever.acquire()
+        try:
+            yield retriever
+        finally:
+            retriever.release()
+
+    def reload_retriever(self, force: bool = False) -> dict:
+        """
+        热加载索引：在调用线程中加载 CURRENT 指向的新版本并预热，完成后原子替换
+        进行中的检索继续使用旧索引，结束后旧索引被释放；加载失败时保留旧索引
+        """
+        with self._reload_lock:
+            version = current_version(self.persist_dir)
+            if not force and self._retriever is not None and version == self.index_version:
+                return {"reloaded": False, "version": version}
+
+            start = time.time()
+            # 先登记新版本，旧版本在进行中的检索结束前同样保留
+            self._mark_served(version, self.index_version)
+            retriever = self._load_retriever(version)
+            retriever.search("warm up", k=1)
+            with self._lock:
+                old, self._retriever = self._retriever, retriever
+                previous, self.index_version = self.index_version, version
+            if old is not None:
+                old.retire()
+            self.timings["index_reload"] = round(time.time() - start, 3)
+            print(f"🔁 索引已切换: {previous} -> {version}（{self.timings['index_reload']}s）")
+            return {"reloaded": True, "version": version, "previous": previous}
+
+    @property
+    def classifier(self):
+        if self._classifier is None:
+            with self._lock:
+                if self._classifier is None:
+                    from agents.classifier_agent import ClassifierAgent
+                    self._classifier = ClassifierAgent(
+                        llm=self.llm, pre_classifier=self.pre_classifier, summarizer=self.summarizer
+                    )
+        return self._classifier
+
+    @property
+    def pre_classifier(self):
+        """本地预分类器，PRE_CLASSIFIER=0 时关闭"""
+        if self._pre_classifier is None and os.getenv("PRE_CLASSIFIER", "1") != "0":
+            with self._lock:
+                if self._pre_classifier is None:
+                    from agents.pre_classifier import PreClassifier
+                    self._pre_classifier = PreClassifier(
+                        embeddings=self.embeddings,
+                        threshold=float(os.getenv("PRE_CLASSIFIER_THRESHOLD", "0.85")),
+                        shadow_rate=float(os.getenv("PRE_CLASSIFIER_SHADOW_RATE", "0.05")),
+                    )
+        return self._pre_classifier
+
+    @property
+    def replier(self):
+        if self._replier is None:
+            with self._lock:
+                if self._replier is None:
+                    from agents.reply_agent import ReplyAgent
+                    from core.context_packer import ContextPacker, TokenCounter
+                    packer = ContextPacker(
+                        TokenCounter(os.getenv("REPLY_TOKENIZER", "deepseek-ai/DeepSeek-V3")),
+                        budget=int(os.getenv("REPLY_CONTEXT_TOKENS", "3000")),
+                        embeddings=self.embeddings,
+                    )
+                    self._replier = ReplyAgent(llm=self.llm, packer=packer)
+        return self._replier
+
+    @property
+    def summarizer(self):
+        if self._summarizer is None:
+            with self._lock:
+                if self._summarizer is None:
+                    from agents.summary_agent import SummaryAgent
+                    from core.thread_summary import ThreadSummaryStore
+                    self._summarizer = SummaryAgent(
+                        llm=self.llm,
+                        store=ThreadSummaryStore(os.getenv("THREAD_SUMMARY_DB", "data/thread_summaries.db")),
+                        keep_recent=int(os.getenv("THREAD_RECENT_COMMENTS", "5")),
+                    )
+        return self._summarizer
+
+    @property
+    def reranker(self):
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    from agents.rerank_agent import RerankAgent
+                    self._reranker = RerankAgent(
+                        model_name=os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"),
+                        top_n=int(os.getenv("RERANK_TOP_N", "5")),
+                        budget_ms=float(os.getenv("RERANK_BUDGET_MS", "300")),
+                    )
+        return self._reranker
+
+    def _timed(self, name: str, fn):
+        start = time.time()
+        result = fn()
+        self.timings[name] = round(time.time() - start, 3)
+        return result
+
+    def warm_up(self):
+        """创建全部资源并跑一次空查询，使模型权重与向量库真正加载到内存"""
+        self.state = "warming"
+        self.error = None
+        try:
+            self._timed("llm", lambda: self.llm)
+            self._timed("retriever", lambda: self.retriever)
+            self._timed("embedding", lambda: self.embeddings.embed_query("warm up"))
+            self._timed("agents", lambda: (self.summarizer, self.classifier, self.replier))
+            self._timed("tokenizer", lambda: self.replier.packer.counter.count("warm up"))
+            if self.pre_classifier:
+                self._timed("pre_classifier", lambda: self.pre_classifier.classify(["warm up"]))
+            if self.rerank_enabled:
+                self._timed("reranker", lambda: self.reranker.model.predict([("warm up", "warm up")]))
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"❌ 资源预热失败: {e}")
+            raise
+        self.state = "ready"
+        print(f"🔥 资源预热完成: {self.timings}")
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "timings": self.timings,
+            "index_version": self.index_version,
+            "pre_classifier": self._pre_classifier.stats() if self._pre_classifier else None,
+            "embeddings": self._embeddings.stats() if self._embeddings else None,
+            "reranker": self._reranker.stats() if self._reranker else None,
+            "summarizer": self._summarizer.stats() if self._summarizer else None,
+        }
+
+
+_registry: ResourceRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_resources() -> ResourceRegistry:
+    """返回进程内唯一的 ResourceRegistry（懒创建）"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                # INDEX_ROOT: 服务检索的索引根目录，sync 发布到 data/chroma_db，流水线发布到 data/pipeline_index
+                _registry = ResourceRegistry(persist_dir=os.getenv("INDEX_ROOT", "data/chroma_db"))
+    return _registry
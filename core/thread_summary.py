@@ -0,0 +1,63 @@
+# core/thread_summary.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def fingerprint(comments: list[str]) -> str:
+    """已折叠评论的指纹，用于发现评论被编辑或删除"""
+    digest = hashlib.sha256()
+    for comment in comments:
+        digest.update(comment.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ThreadSummaryStore:
+    """
+    按 Issue 持久化的滚动摘要
+    - 每条记录保存：摘要正文、已折叠进摘要的评论数、这些评论的指纹
+    - SQLite（WAL），多线程共享一个连接，写操作加锁
+    """
+
+    def __init__(self, db_path: str = "data/thread_summaries.db"):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thread_summaries (
+                issue_key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                folded_count INTEGER NOT NULL,
+                folded_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+    def get(self, issue_key: str) -> Optional[tuple[str, int, str]]:
+        """返回 (摘要, 已折叠评论数, 指纹)，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, folded_count, folded_hash FROM thread_summaries WHERE issue_key = ?", (issue_key,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, issue_key: str, summary: str, folded_count: int, folded_hash: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thread_summaries (issue_key, summary, folded_count, folded_hash, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (issue_key, summary, folded_count, folded_hash, time.time()),
+            )
+
+    def delete(self, issue_key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM thread_summaries WHERE issue_key = ?", (issue_key,))
@@ -0,0 +1,176 @@
+# core/vector_index.py
+import json
+import os
+from typing import Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+INDEX_META_FILE = "index.json"
+VECTORS_FILE = "embeddings.npy"
+DOCS_FILE = "docs.jsonl"
+
+
+def detect_index_type(persist_dir: str) -> str:
+    """根据 persist_dir 下的 index.json 判断索引类型，不存在时视为 Chroma"""
+    meta_path = os.path.join(persist_dir, INDEX_META_FILE)
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("type", "chroma")
+    return "chroma"
+
+
+def iter_ids(persist_dir: str):
+    """逐行读取 NumPy 索引的文本块 ID（与向量矩阵的行号一一对应），不保留文本与元数据"""
+    with open(os.path.join(persist_dir, DOCS_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)["id"]
+
+
+def _normalize(vectors) -> np.ndarray:
+    arr = np.asarray(vectors, dtype=np.float32)
+    if arr.ndim == 1:
+        return arr / max(float(np.linalg.norm(arr)), 1e-12)
+    return arr / np.maximum(np.linalg.norm(arr, axis=1, keepdims=True), 1e-12)
+
+
+class NumpyVectorIndex:
+    """
+    轻量级进程内向量索引，适用于几千条 FAQ 文本块的小语料
+    - 向量归一化后存为 .npy（默认 float32），通过 mmap 加载，多个 worker 进程共享同一份物理页
+    - 文本与元数据存于 JSONL 旁路文件
+    - 检索为一次向量化点积 + argpartition，无需 Chroma 的导入与启动开销
+    - 接口与 Chroma 的 similarity_search 保持一致，可直接替换 RetrieverAgent 中的 db
+    - float16 索引（dtype="float16" 构建，体积减半）检索时按块转换，仍共享 mmap 页；
+      upcast=True 时加载即转换为进程内 float32 副本，检索更快但每个进程各占一份内存
+    """
+
+    def __init__(self, persist_dir: str, embedding_function: Embeddings, block_rows: int = 65536, upcast: bool = False):
+        self.persist_dir = persist_dir
+        self.embedding_function = embedding_function
+        self.block_rows = block_rows
+
+        with open(os.path.join(persist_dir, INDEX_META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(persist_dir, VECTORS_FILE), mmap_mode="r")
+        if upcast and self.vectors.dtype != np.float32:
+            self.vectors = np.asarray(self.vectors, dtype=np.float32)
+        self.ids: list[str] = []
+        self.docs: list[Document] = []
+        with open(os.path.join(persist_dir, DOCS_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.docs.append(Document(page_content=record["page_content"], metadata=record["metadata"]))
+
+    @classmethod
+    def build(
+        cls,
+        texts: list[str],
+        metadatas: list[dict],
+        embedding_function: Embeddings,
+        persist_dir: str,
+        ids: Optional[list[str]] = None,
+        vectors=None,
+        dtype: str = "float32",
+    ) -> "NumpyVectorIndex":
+        """
+        生成索引文件；先写临时文件再原子替换，最后写 index.json
+        - vectors: 已计算好的向量，不传则调用 embedding_function 计算
+        - dtype: 向量存储精度，float32 可直接 mmap 检索，float16 体积减半但检索时需逐块转换
+        """
+        ids = ids or [str(i) for i in range(len(texts))]
+        if vectors is None:
+            vectors = embedding_function.embed_documents(texts) if texts else []
+        writer = NumpyIndexWriter(persist_dir, dtype)
+        writer.add(ids, texts, metadatas, vectors)
+        writer.commit()
+        return cls(persist_dir, embedding_function)
+
+    def _scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """分块计算余弦相似度，限制 float16 -> float32 转换的临时内存"""
+        if self.vectors.dtype == np.float32 or len(self.vectors) <= self.block_rows:
+            return self.vectors @ query_vector
+        return np.concatenate([
+            self.vectors[i:i + self.block_rows] @ query_vector
+            for i in range(0, len(self.vectors), self.block_rows)
+        ])
+
+    def similarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4) -> list[tuple[Document, float]]:
+        if not self.docs:
+            return []
+        scores = self._scores(_normalize(embedding))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.docs[i], float(scores[i])) for i in top]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        """返回 (文档, 余弦相似度)，相似度越大越相关（注意与 Chroma 的距离语义相反）"""
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+
+class NumpyIndexWriter:
+    """
+    流式写入 NumpyVectorIndex 的索引文件，内存占用与语料规模无关
+    - add: 向量追加写入原始二进制临时文件，文本与元数据追加写入 JSONL 临时文件
+    - commit: 按总行数生成 .npy（分块拷贝），原子替换正式文件，最后写 index.json
+    """
+
+    def __init__(self, persist_dir: str, dtype: str = "float32", block_rows: int = 65536):
+        os.makedirs(persist_dir, exist_ok=True)
+        self.persist_dir = persist_dir
+        self.dtype = np.dtype(dtype)
+        self.block_rows = block_rows
+        self.count = 0
+        self.dim = 0
+        self._raw_path = os.path.join(persist_dir, VECTORS_FILE + ".raw")
+        self._docs_tmp = os.path.join(persist_dir, DOCS_FILE + ".tmp")
+        self._raw = open(self._raw_path, "wb")
+        self._docs = open(self._docs_tmp, "w", encoding="utf-8")
+
+    def add(self, ids: list[str], texts: list[str], metadatas: list[dict], vectors):
+        if not texts:
+            return
+        matrix = _normalize(vectors).astype(self.dtype)
+        if self.dim and matrix.shape[1] != self.dim:
+            raise ValueError(f"向量维度不一致: {matrix.shape[1]} != {self.dim}")
+        self.dim = matrix.shape[1]
+        self._raw.write(matrix.tobytes())
+        for id_, text, metadata in zip(ids, texts, metadatas):
+            self._docs.write(json.dumps({"id": id_, "page_content": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+        self.count += len(texts)
+
+    def commit(self):
+        self._raw.close()
+        self._docs.close()
+        vectors_tmp = os.path.join(self.persist_dir, VECTORS_FILE + ".tmp")
+        matrix = np.lib.format.open_memmap(vectors_tmp, mode="w+", dtype=self.dtype, shape=(self.count, self.dim))
+        if self.count:
+            raw = np.memmap(self._raw_path, dtype=self.dtype, mode="r", shape=(self.count, self.dim))
+            for i in range(0, self.count, self.block_rows):
+                matrix[i:i + self.block_rows] = raw[i:i + self.block_rows]
+            del raw
+        matrix.flush()
+        del matrix
+        os.remove(self._raw_path)
+        os.replace(vectors_tmp, os.path.join(self.persist_dir, VECTORS_FILE))
+        os.replace(self._docs_tmp, os.path.join(self.persist_dir, DOCS_FILE))
+
+        meta = {"type": "numpy", "count": self.count, "dim": self.dim, "dtype": self.dtype.name}
+        meta_path = os.path.join(self.persist_dir, INDEX_META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def abort(self):
+        """放弃本次写入，删除临时文件，正式文件保持不变"""
+        self._raw.close()
+        self._docs.close()
+        for path in (self._raw_path, self._docs_tmp):
+            if os.path.exists(path):
+                os.remove(path)
@@ -1,30 +1,105 @@
 # graphs/issue_graph.py
+import asyncio
+from functools import partial
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from core.issue_state import IssueState
-from agents.classifier_agent import classify_node
-from agents.retriever_agent import retriever_node
-from agents.reply_agent import reply_node
+from agents.classifier_agent import classify_node, aclassify_node
+from agents.retriever_agent import retriever_node, aretriever_node
+from agents.reply_agent import reply_node, areply_node
+from agents.rerank_agent import rerank_node, arerank_node
+from agents.summary_agent import summarize_node, asummarize_node
+from core.resources import ResourceRegistry, get_resources
 
 
 
-def build_issue_graph():
+def build_issue_graph(
+    resources: ResourceRegistry | None = None,
+    speculative: bool = False,
+    rerank: bool | None = None,
+):
+    """
+    构建 Issue 处理图
+    - resources: 共享资源注册表，节点从中获取预热好的 LLM / 模型 / 向量库；不传则使用进程默认注册表
+    - speculative: 推测执行模式，分类的同时启动向量检索，检索不再位于关键路径上；
+      分类结果无需回复时丢弃检索结果
+    - rerank: 在检索与回复之间插入交叉编码器重排节点，检索多取候选；不传则按 resources.rerank_enabled
+    - 讨论摘要只在需要回复时、回复之前生成，不占用分类（含预分类快速路径）与推测检索的关键路径
+    """
+    resources = resources or get_resources()
+    rerank = resources.rerank_enabled if rerank is None else rerank
+    # 开启重排时检索阶段多取候选，由重排节点截断
+    k = resources.rerank_candidates if rerank else None
+
     # 创建状态图，并指定状态类型
     graph = StateGraph(IssueState)
 
-    graph.add_node("classifier", classify_node)
-    graph.add_node("retriever", retriever_node)
-    graph.add_node("reply", reply_node)
-
-
+    if speculative:
+        graph.add_node("classifier", _node(
+            partial(speculative_classify_node, k=k), partial(aspeculative_classify_node, k=k), resources
+        ))
+    else:
+        graph.add_node("classifier", _node(classify_node, aclassify_node, resources))
+        graph.add_node("retriever", _node(partial(retriever_node, k=k), partial(aretriever_node, k=k), resources))
+    if rerank:
+        graph.add_node("rerank", _node(rerank_node, arerank_node, resources))
+    # 回复前将较早的评论增量折叠进讨论摘要，回复只使用摘要 + 最新评论
+    graph.add_node("summarize", _node(summarize_node, asummarize_node, resources))
+    graph.add_node("reply", _node(reply_node, areply_node, resources))
 
+    after_retrieval = "rerank" if rerank else "summarize"
     graph.add_edge(START, "classifier")
-    graph.add_conditional_edges("classifier", should_retrieve)
-    graph.add_edge("retriever", "reply")
+    if speculative:
+        # 检索已在分类节点内完成，需要回复时直接进入重排或 reply
+        graph.add_conditional_edges("classifier", should_retrieve, {"retriever": after_retrieval, END: END})
+    else:
+        graph.add_conditional_edges("classifier", should_retrieve)
+        graph.add_edge("retriever", after_retrieval)
+    if rerank:
+        graph.add_edge("rerank", "summarize")
+    graph.add_edge("summarize", "reply")
     graph.add_edge("reply", END)
 
     return graph.compile()
 
 
+def speculative_classify_node(state: IssueState, resources: ResourceRegistry, k: int | None = None) -> IssueState:
+    """推测执行节点（同步版本）：检索提交到 CPU 线程池，与分类的 LLM 调用并行"""
+    retrieval = resources.executor.submit(retriever_node, dict(state), resources, k)
+    state = resources.classifier.analyze_comments(state)
+    if not state.get("need_reply", False):
+        retrieval.cancel()  # 尚未开始则直接取消，已在执行则结果被丢弃
+        return state
+    state["retrieved_docs"] = retrieval.result()["retrieved_docs"]
+    return state
+
+
+async def aspeculative_classify_node(state: IssueState, resources: ResourceRegistry, k: int | None = None) -> IssueState:
+    """推测执行节点（异步版本）"""
+    # 检索使用状态副本，避免与分类并发写同一个 dict
+    retrieval = asyncio.create_task(aretriever_node(dict(state), resources, k))
+    try:
+        state = await resources.classifier.aanalyze_comments(state)
+    except BaseException:
+        retrieval.cancel()
+        raise
+    if not state.get("need_reply", False):
+        retrieval.cancel()
+        # 取走可能的异常，避免 "exception was never retrieved" 警告
+        retrieval.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return state
+    state["retrieved_docs"] = (await retrieval)["retrieved_docs"]
+    return state
+
+
+def _node(func, afunc, resources: ResourceRegistry) -> RunnableLambda:
+    """同时注册同步与异步实现：invoke 走同步版本，ainvoke 走原生异步版本"""
+    return RunnableLambda(
+        partial(func, resources=resources),
+        afunc=partial(afunc, resources=resources),
+    )
+
+
 def should_retrieve(state: IssueState):
     """判断是否进入retriever节点"""
     return "retriever" if state.get("need_reply", False) else END
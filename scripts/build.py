@@ -1,61 +1,385 @@
-from langchain_core.embeddings import Embeddings
-from sentence_transformers import SentenceTransformer
-from langchain_community.vectorstores import Chroma
-from langchain_core.documents import Document
+import hashlib
 import json
+import multiprocessing
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from tqdm import tqdm
+from core.embeddings import LocalEmbeddings
+from core.vector_index import VECTORS_FILE, NumpyIndexWriter, iter_ids
+from core.lexical_index import BM25Writer
+from core.index_store import prune_versions, publish_version, stage_version
 
-class LocalEmbeddings(Embeddings):
-    def __init__(self, model_name: str = "BAAI/bge-small-zh"):
-        self.model = SentenceTransformer(model_name)
+MANIFEST_FILE = "manifest.json"
+COLLECTION_NAME = "issues"
+# 默认向量化进程数：每个进程各加载一份模型，进程多了内存与启动开销成倍增长
+DEFAULT_WORKERS = min(4, max(1, (os.cpu_count() or 1) // 2))
+MANIFEST_VERSION = 1
+EMBEDDING_MODEL = "BAAI/bge-small-zh"
 
-    def embed_query(self, text: str):
-        return self.model.encode(text).tolist()  # 转为 list
 
-    def embed_documents(self, texts: list[str]):
-        return self.model.encode(texts).tolist()  # 转为 list
+def faq_to_text(faq: dict) -> str:
+    return f"Q: {faq['question']}\nSteps:\n" + "\n".join(faq.get("steps", [])) + f"\nA: {faq.get('answer','')}"
 
 
-def build_vector_db(json_file: str, persist_dir: str):
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(persist_dir: str) -> dict:
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(persist_dir: str, manifest: dict):
+    """先写临时文件再原子替换，中途失败时保留上一次的清单"""
+    os.makedirs(persist_dir, exist_ok=True)
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def iter_faqs(path: str, read_size: int = 1 << 20) -> Iterator[dict]:
     """
-    从 FAQ JSON 文件生成向量数据库并存储
+    逐条读取 FAQ 记录，不把整个文件载入内存
+    - JSONL：每行一条
+    - JSON 数组：按块读取，用 raw_decode 逐个解析数组元素
     """
-    # 读取 JSON
-    with open(json_file, "r", encoding="utf-8") as f:
-        faqs = json.load(f)
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(read_size).lstrip()
+        if not buf.startswith("["):
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        pos, eof = 1, False
+        while True:
+            # 跳过元素之间的空白与逗号
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos >= len(buf):
+                    raise json.JSONDecodeError("需要更多数据", buf, pos)
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(read_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield record
+            pos = end
+            if pos > read_size:
+                buf, pos = buf[pos:], 0
 
-    # 构建 Document 对象
-    docs = [
-        Document(
-            page_content=f"Q: {i['question']}\nSteps:\n" + "\n".join(i.get("steps", [])) + f"\nA: {i.get('answer','')}",
-            metadata={"title": i.get("question", "")}
-        )
-        for i in faqs
-    ]
 
-    # 文本切分
+def iter_chunks(faqs: Iterator[dict]) -> Iterator[tuple[str, list[str], list[str], dict]]:
+    """
+    切分 FAQ 并生成确定性的文本块 ID
+    - FAQ 哈希：sha256(拼接后的 Q/Steps/A 文本)，内容不变则哈希不变
+    - 文本块 ID：{FAQ 哈希}-{块序号}，同一内容多次构建得到相同 ID
+    逐条产出 (FAQ 哈希, [文本块 ID], [文本块], 元数据)，完全相同的 FAQ 只产出一次
+    """
     splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-    split_docs = splitter.split_documents(docs)
-    print(f"✂️ 已分割为 {len(split_docs)} 条文本块，开始生成向量...")
+    seen = set()
+    for faq in faqs:
+        text = faq_to_text(faq)
+        faq_hash = content_hash(text)
+        if faq_hash in seen:
+            continue
+        seen.add(faq_hash)
+        chunks = splitter.split_text(text)
+        metadata = {"title": faq.get("question", ""), "faq_id": faq_hash}
+        yield faq_hash, [f"{faq_hash}-{i}" for i in range(len(chunks))], chunks, metadata
+
+
+_worker_embeddings = None
 
-    # 提取文本和元数据
-    texts = [d.page_content for d in split_docs]
-    metadatas = [d.metadata for d in split_docs]
 
-    # 初始化嵌入模型
-    embeddings = LocalEmbeddings("BAAI/bge-small-zh")
+def _init_worker(model_name: str, backend: str, threads: int):
+    """子进程初始化：每个进程只加载一次模型，并限制推理线程数，避免多进程间 CPU 超订"""
+    global _worker_embeddings
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    # 子进程只用内存缓存，避免多个进程同时写共享的 SQLite 向量缓存
+    _worker_embeddings = LocalEmbeddings(model_name, cache_path=None, backend=backend)
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+class ParallelEmbedder:
+    """
+    向量化阶段
+    - 批次提交到进程池，在途批次数不超过 max_pending（背压），读取与切分不会无限领先
+    - 结果按提交顺序取回；workers <= 1 时在当前进程内计算
+    - 模型在首次需要向量化时才加载，索引无变化时不产生加载开销
+    - 待向量化的文本块少于 pool_threshold 时（如日常增量同步）先缓冲，最终在当前进程内计算，
+      不启动进程池；超过阈值才启动进程池并转交已缓冲的批次
+    """
+
+    def __init__(self, workers: int, backend: str = "torch", max_pending: int | None = None, pool_threshold: int = 1024):
+        self.workers = workers
+        self.backend = backend
+        self.max_pending = max_pending or workers * 2
+        self.pool_threshold = pool_threshold
+        self._submitted = 0
+        self._pool = None
+        self._local = None
+        self._pending: deque = deque()
+
+    def _embed_local(self, texts: list[str]) -> list[list[float]]:
+        if self._local is None:
+            self._local = LocalEmbeddings(EMBEDDING_MODEL, backend=self.backend)
+        return self._local.embed_documents(texts)
+
+    def _start_pool(self):
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(EMBEDDING_MODEL, self.backend, threads),
+        )
+        # 此前缓冲的批次转交进程池
+        self._pending = deque(
+            (batch, self._pool.submit(_embed_batch, batch[1]) if result is None else result)
+            for batch, result in self._pending
+        )
 
-    # 创建 Chroma 向量数据库并批量添加
-    db = Chroma(
-        collection_name="issues",
-        persist_directory=persist_dir,
-        embedding_function=embeddings
+    def submit(self, batch: tuple[list[str], list[str], list[dict]]) -> list:
+        """提交 (ids, texts, metadatas) 批次，返回已完成的 [(批次, 向量)]；在途已满时阻塞等待最早的批次"""
+        done = []
+        self._submitted += len(batch[1])
+        if self.workers > 1 and self._pool is None and self._submitted >= self.pool_threshold:
+            self._start_pool()
+        buffering = self.workers > 1 and self._pool is None
+        # 缓冲阶段的批次数受 pool_threshold 限制，不做背压
+        while not buffering and len(self._pending) >= self.max_pending:
+            done.append(self._pop())
+        if self._pool is not None:
+            self._pending.append((batch, self._pool.submit(_embed_batch, batch[1])))
+        elif buffering:
+            self._pending.append((batch, None))
+        else:
+            self._pending.append((batch, self._embed_local(batch[1])))
+        return done
+
+    def _pop(self):
+        batch, result = self._pending.popleft()
+        if result is None:
+            return batch, self._embed_local(batch[1])
+        return batch, result if isinstance(result, list) else result.result()
+
+    def drain(self) -> list:
+        return [self._pop() for _ in range(len(self._pending))]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+
+def build_vector_db(
+    json_file: str | Iterable[dict],
+    persist_dir: str,
+    index_type: str = "chroma",
+    full: bool = False,
+    workers: int | None = None,
+    batch_size: int = 64,
+    backend: str = "torch",
+    dtype: str = "float32",
+):
+    """
+    从 FAQ 文件（JSON 数组或 JSONL）或 FAQ 迭代器流式、增量生成向量数据库并存储
+    - json_file 传入迭代器时边消费边构建，可直接接在 FAQ 生成阶段之后（见 scripts/pipeline.py）
+    - 流水线：逐条读取 -> 切分 -> 多进程批量向量化 -> 分批写入索引，内存占用不随语料增长
+    - index_type: chroma 或 numpy（mmap 的 .npy 矩阵 + JSONL 元数据，适合小语料）
+    - 以 FAQ 内容哈希为键，persist_dir/manifest.json 记录已入库的文本块 ID；
+      每次构建只向量化并写入新增 / 变更的文本块，删除已不存在的 FAQ 对应的文本块，重复执行结果不变
+    - full: 忽略清单，清空后全量重建
+    - workers: 向量化进程数，默认 DEFAULT_WORKERS；新增文本块不多时只在当前进程内计算；batch_size: 每批文本块数
+    - backend: 向量推理后端，应与服务端 EMBEDDING_BACKEND 一致
+    - dtype: NumPy 索引的向量存储精度（float32 / float16），改变精度时复用已有向量并转换
+    """
+    workers = workers or DEFAULT_WORKERS
+
+    # 清单与当前索引类型、向量模型不一致时（或旧版无清单的索引）只能全量重建
+    manifest = load_manifest(persist_dir)
+    has_index = os.path.isdir(persist_dir) and bool(os.listdir(persist_dir))
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("index_type") != index_type \
+            or manifest.get("model") != EMBEDDING_MODEL or manifest.get("backend", "torch") != backend:
+        full = full or has_index
+        manifest = {}
+    previous = {} if full else manifest.get("faqs", {})
+
+    # 写入阶段：BM25 与 NumPy 索引先写临时文件，成功后原子替换；Chroma 直接 upsert
+    bm25 = BM25Writer(persist_dir)
+    existing, existing_rows = None, {}
+    if index_type == "numpy":
+        writer = NumpyIndexWriter(persist_dir, dtype)
+        if not full and os.path.exists(os.path.join(persist_dir, "index.json")):
+            # 已有向量按 ID 复用：矩阵 mmap 读取，docs.jsonl 只取 ID 映射到行号，文本与元数据不载入内存
+            existing = np.load(os.path.join(persist_dir, VECTORS_FILE), mmap_mode="r")
+            existing_rows = {chunk_id: i for i, chunk_id in enumerate(iter_ids(persist_dir))}
+    else:
+        import chromadb
+
+        # 向量已由进程池算好，直接写入 chromadb 集合（公开 API），与 langchain_chroma 读取同一集合
+        client = chromadb.PersistentClient(path=persist_dir)
+        if full:
+            try:
+                client.delete_collection(COLLECTION_NAME)
+            except Exception:
+                pass  # 集合不存在
+        collection = client.get_or_create_collection(COLLECTION_NAME, embedding_function=None)
+
+    def write(results: list):
+        for (ids, texts, metadatas), vectors in results:
+            if index_type == "numpy":
+                writer.add(ids, texts, metadatas, vectors)
+            else:
+                # 指定 ID 时重复执行不会产生重复向量
+                collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+            pbar.update(len(ids))
+
+    embedder = ParallelEmbedder(workers, backend)
+    faq_chunks: dict[str, list[str]] = {}
+    batch: tuple[list[str], list[str], list[dict]] = ([], [], [])
+    reused: tuple[list[str], list[str], list[dict], list[int]] = ([], [], [], [])
+    added = 0
+    start = time.perf_counter()
+    pbar = tqdm(desc="🧮 向量化", unit="块", dynamic_ncols=True)
+
+    try:
+        faqs = iter_faqs(json_file) if isinstance(json_file, str) else json_file
+        for faq_hash, chunk_ids, chunks, metadata in iter_chunks(faqs):
+            faq_chunks[faq_hash] = chunk_ids
+            unchanged = faq_hash in previous
+            for chunk_id, chunk in zip(chunk_ids, chunks):
+                bm25.add(chunk, metadata)
+                if unchanged and existing is None:
+                    continue  # 已在 Chroma 中
+                if unchanged and chunk_id in existing_rows:
+                    for part, value in zip(reused, (chunk_id, chunk, metadata, existing_rows[chunk_id])):
+                        part.append(value)
+                    if len(reused[0]) >= batch_size:
+                        write([(reused[:3], existing[reused[3]])])
+                        reused = ([], [], [], [])
+                    continue
+                batch[0].append(chunk_id)
+                batch[1].append(chunk)
+                batch[2].append(metadata)
+                if len(batch[0]) >= batch_size:
+                    added += len(batch[0])
+                    write(embedder.submit(batch))
+                    batch = ([], [], [])
+        if reused[0]:
+            write([(reused[:3], existing[reused[3]])])
+        if batch[0]:
+            added += len(batch[0])
+            write(embedder.submit(batch))
+        write(embedder.drain())
+    except BaseException:
+        bm25.abort()
+        if index_type == "numpy":
+            writer.abort()
+        raise
+    finally:
+        pbar.close()
+        embedder.close()
+
+    removed = sorted(
+        chunk_id for faq_hash, chunk_ids in previous.items() if faq_hash not in faq_chunks for chunk_id in chunk_ids
     )
-    db.add_texts(texts, metadatas=metadatas)
+    elapsed = time.perf_counter() - start
+    total = sum(len(chunk_ids) for chunk_ids in faq_chunks.values())
+    print(
+        f"✂️ 共 {len(faq_chunks)} 条 FAQ、{total} 条文本块：新增 {added}，删除 {len(removed)}"
+        f"（{elapsed:.1f}s，{added / elapsed if elapsed else 0:.1f} 块/s）"
+    )
+
+    same_dtype = index_type != "numpy" or manifest.get("dtype", "float32") == dtype
+    if not added and not removed and manifest and same_dtype:
+        bm25.abort()
+        if index_type == "numpy":
+            writer.abort()
+        print(f"✅ 索引已是最新：{persist_dir}")
+        return False
+
+    # 词法索引（BM25）与向量索引放在同一目录，检索时做混合召回
+    bm25.commit()
+    print(f"🔤 BM25 词法索引已保存至：{persist_dir}")
+    if index_type == "numpy":
+        del existing
+        writer.commit()
+    elif removed:
+        collection.delete(ids=removed)
 
+    # 清单最后写入：中途失败时下次构建会重新处理未记录的文本块
+    save_manifest(persist_dir, {
+        "version": MANIFEST_VERSION,
+        "index_type": index_type,
+        "model": EMBEDDING_MODEL,
+        "backend": backend,
+        **({"dtype": dtype} if index_type == "numpy" else {}),
+        "faqs": faq_chunks,
+    })
     print(f"✅ 向量数据库已保存至：{persist_dir}")
+    return True
+
+
+def build_index_version(json_file: str | Iterable[dict], root: str, keep: int = 3, **kwargs) -> str | None:
+    """
+    在新的版本目录中构建索引，完成后原子切换 root/CURRENT，运行中的服务检测到后热加载
+    - 以当前版本的拷贝为基础增量构建，服务端正在读取的目录不会被修改
+    - 构建失败或无变化时删除新目录，CURRENT 保持不变
+    - keep: 保留的历史版本数
+    返回新发布的版本名，未发布时返回 None
+    """
+    version, path = stage_version(root)
+    try:
+        changed = build_vector_db(json_file, path, **kwargs)
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    if not changed:
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    publish_version(root, version)
+    removed = prune_versions(root, keep)
+    print(f"🚀 已发布索引版本 {version}" + (f"，清理旧版本 {removed}" if removed else ""))
+    return version
 
 
 chroma_db_path = "data/chroma_db"
 if __name__ == "__main__":
-    build_vector_db("data/issues_faq.json", chroma_db_path)
+    build_index_version(
+        os.getenv("FAQ_FILE", "data/issues_faq.json"),
+        chroma_db_path,
+        keep=int(os.getenv("INDEX_KEEP_VERSIONS", "3")),
+        index_type=os.getenv("INDEX_TYPE", "chroma"),
+        full=os.getenv("FULL_REBUILD") == "1",
+        workers=int(os.getenv("BUILD_WORKERS", "0")) or None,
+        batch_size=int(os.getenv("BUILD_BATCH_SIZE", "64")),
+        backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        dtype=os.getenv("INDEX_DTYPE", "float32"),
+    )
@@ -0,0 +1,159 @@
+"""
+向量推理后端校验与基准测试
+
+用法：
+    # 校验 onnx-int8 向量与 PyTorch 参考模型的余弦相似度及检索一致性
+    python -m scripts.embedding_bench verify --backend onnx-int8
+
+    # 对比各后端的加载耗时、单条延迟、批量吞吐与内存占用（每个后端独立子进程）
+    python -m scripts.embedding_bench bench --backends torch onnx onnx-int8
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from core.embeddings import BACKENDS, load_sentence_transformer
+
+SAMPLE_TEXTS = [
+    "如何上传超过20MB的大文件到Gitlab？",
+    "CUDA out of memory when running model",
+    "csghub 部署后无法登录，提示 token 过期",
+    "模型推理服务启动失败，日志显示 port already in use",
+    "请问如何配置 S3 存储作为模型仓库的后端？",
+    "Dataset viewer shows 500 error after upgrading to v1.2.0",
+    "怎样在 Kubernetes 中配置 GPU 资源限制",
+    "git lfs push 时报错 batch response: Authentication required",
+]
+
+
+def load_texts(faq_file: str, limit: int) -> list[str]:
+    """优先使用 FAQ 语料作为测试文本，不存在时退回内置样例"""
+    if os.path.exists(faq_file):
+        with open(faq_file, "r", encoding="utf-8") as f:
+            faqs = json.load(f)
+        texts = [f"{i['question']}\n{i.get('answer', '')}" for i in faqs][:limit]
+        if texts:
+            return texts
+    return (SAMPLE_TEXTS * (limit // len(SAMPLE_TEXTS) + 1))[:limit]
+
+
+def _normalize(vectors) -> np.ndarray:
+    arr = np.asarray(vectors, dtype=np.float32)
+    return arr / np.maximum(np.linalg.norm(arr, axis=1, keepdims=True), 1e-12)
+
+
+def verify(args) -> int:
+    texts = load_texts(args.faq_file, args.limit)
+    reference = _normalize(load_sentence_transformer(args.model, "torch").encode(texts))
+    candidate = _normalize(load_sentence_transformer(args.model, args.backend).encode(texts))
+
+    cosine = (reference * candidate).sum(axis=1)
+
+    # 检索一致性：以每条文本为查询，比较两个后端的 top-k 近邻重合率
+    k = min(args.top_k, len(texts))
+    ref_top = np.argsort(-(reference @ reference.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(candidate @ candidate.T), axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)])
+
+    print(f"📐 {args.backend} vs torch（{len(texts)} 条文本）")
+    print(f"   余弦相似度: min={cosine.min():.4f} mean={cosine.mean():.4f}")
+    print(f"   top-{k} 近邻重合率: {overlap:.3f}")
+    if cosine.min() < args.threshold:
+        print(f"❌ 最小余弦相似度低于阈值 {args.threshold}")
+        return 1
+    print("✅ 向量一致性校验通过")
+    return 0
+
+
+def _run_single(args) -> int:
+    """子进程：测量单个后端，结果以 JSON 输出到 stdout"""
+    texts = load_texts(args.faq_file, args.limit)
+
+    start = time.perf_counter()
+    model = load_sentence_transformer(args.model, args.backend)
+    load_seconds = time.perf_counter() - start
+    model.encode(texts[:2])  # 预热
+
+    latencies = []
+    for text in texts[: args.queries]:
+        t = time.perf_counter()
+        model.encode(text)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    start = time.perf_counter()
+    model.encode(texts, batch_size=args.batch_size)
+    throughput = len(texts) / (time.perf_counter() - start)
+
+    # Linux 下 ru_maxrss 单位为 KB，macOS 为字节
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+    print(json.dumps({
+        "backend": args.backend,
+        "load_seconds": round(load_seconds, 2),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(sorted(latencies)[int(len(latencies) * 0.95) - 1], 2),
+        "throughput": round(throughput, 1),
+        "peak_rss_mb": round(rss_mb, 1),
+    }))
+    return 0
+
+
+def bench(args) -> int:
+    results = []
+    for backend in args.backends:
+        cmd = [
+            sys.executable, "-m", "scripts.embedding_bench",
+            "--model", args.model, "--faq-file", args.faq_file, "--limit", str(args.limit),
+            "_run", "--backend", backend, "--queries", str(args.queries), "--batch-size", str(args.batch_size),
+        ]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"⚠️ 后端 {backend} 测试失败:\n{proc.stderr[-2000:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'backend':<12}{'load(s)':>9}{'p50(ms)':>9}{'p95(ms)':>9}{'texts/s':>10}{'RSS(MB)':>10}")
+    for r in results:
+        print(
+            f"{r['backend']:<12}{r['load_seconds']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+            f"{r['throughput']:>10}{r['peak_rss_mb']:>10}"
+        )
+    return 0 if results else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="向量推理后端校验与基准测试")
+    parser.add_argument("--model", default="BAAI/bge-small-zh")
+    parser.add_argument("--faq-file", default="data/issues_faq.json")
+    parser.add_argument("--limit", type=int, default=256, help="测试文本数量")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_verify = sub.add_parser("verify", help="校验后端向量与 PyTorch 参考模型的一致性")
+    p_verify.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    p_verify.add_argument("--threshold", type=float, default=0.98, help="允许的最小余弦相似度")
+    p_verify.add_argument("--top-k", type=int, default=5)
+
+    p_bench = sub.add_parser("bench", help="对比各后端的延迟、吞吐与内存")
+    p_bench.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    p_bench.add_argument("--queries", type=int, default=100, help="单条延迟测试次数")
+    p_bench.add_argument("--batch-size", type=int, default=32)
+
+    p_run = sub.add_parser("_run")
+    p_run.add_argument("--backend", choices=BACKENDS, required=True)
+    p_run.add_argument("--queries", type=int, default=100)
+    p_run.add_argument("--batch-size", type=int, default=32)
+
+    args = parser.parse_args()
+    return {"verify": verify, "bench": bench, "_run": _run_single}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
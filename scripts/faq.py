@@ -1,37 +1,34 @@
 from core.llm import get_llm
+from core.embeddings import LocalEmbeddings
+from core.rate_limiter import AsyncRateLimiter
+from tqdm import tqdm
+import numpy as np
+import asyncio
+import hashlib
 import json
+import os
+import random
+import re
+import time
+from typing import AsyncIterator, Iterator
 
-llm = get_llm()
+# 不使用响应缓存：缓存保存的是解析前的原始输出，格式错误的结果会在每次重试、每次续跑时被原样重放
+llm = get_llm(cache=False)
 
-def generate_issue_faq(issues: list[dict], output_file: str = "data/issues_faq.json"):
-    """
-    使用 LLM 将每条 Issue 整理成 1-2 个 Q&A，包含解决步骤，并写入 JSON 文件
-    输出格式：
-    [
-        {
-            "question": "问题描述",
-            "steps": ["步骤1", "步骤2"],
-            "answer": "最终解决结果",
-        }
-    ]
-    """
-    all_faq = []
-
-    for issue in issues:
-        prompt = f"""
+FAQ_PROMPT = """
 请根据以下 GitHub Issue 及所有评论，生成尽可能完整的 Q&A 列表，要求：
 1. 每条 Q&A 包含：
 - question: 提炼问题描述
 - steps: 从评论中整理出真正可执行的解决步骤
 - answer: 问题最终结果或结论
-2. Q&A 数量根据评论内容自动生成，不超过 3 条  
+2. Q&A 数量根据评论内容自动生成，不超过 3 条
 3. 输出 **纯 JSON**，不要 Markdown 或多余文本
 
 过滤掉不能实际解决问题的 Q&A，只保留能实际解决问题的 Q&A。
 
-标题: {issue['title']}
-正文: {issue['body']}
-评论: {"; ".join(issue['comments'])}
+标题: {title}
+正文: {body}
+评论: {comments}
 
 输出 JSON 格式示例：
 [
@@ -47,18 +44,256 @@ def generate_issue_faq(issues: list[dict], output_file: str = "data/issues_faq.j
   }}
 ]
 """
+
+
+def issue_key(issue: dict) -> str:
+    """日志中识别 Issue 的键：有仓库名时为 repo#number，否则为 number"""
+    return f"{issue['repo']}#{issue['number']}" if issue.get("repo") else str(issue["number"])
+
+
+def issue_source(issue: dict) -> dict:
+    """FAQ 条目的来源 Issue，去重合并时一并保留"""
+    source = {"number": issue["number"]}
+    if issue.get("repo"):
+        source["repo"] = issue["repo"]
+    return source
+
+
+def issue_hash(issue: dict) -> str:
+    """Issue 内容指纹，标题、正文或评论变化后需要重新生成"""
+    text = json.dumps([issue.get("title"), issue.get("body"), issue.get("comments")], ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class FaqJournal:
+    """
+    FAQ 生成日志（JSONL），每处理完一条 Issue 追加一行，崩溃后可从断点继续
+    每行：{"key", "hash", "status": "ok" | "error", "faqs", "error", "ts"}，同一键以最后一行为准
+    内存中只保留每个键的状态、指纹、行偏移和最近一次成功行的偏移，FAQ 正文按需从文件读取
+    最近一次生成失败时，done() 仍为 False（下次重试），但 FAQ 沿用最近一次成功的结果，避免条目从索引中消失
+    """
+
+    def __init__(self, path: str = "data/faq_journal.jsonl"):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        offset = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self._set(entry["key"], entry.get("hash"), entry["status"], offset)
+                    except (json.JSONDecodeError, KeyError):
+                        pass  # 崩溃时写了一半的行
+                    offset += len(line)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "ab")
+        if offset and not line.endswith(b"\n"):
+            self._file.write(b"\n")  # 补齐写了一半的行，新记录从新行开始
+            offset += 1
+        self._offset = offset
+        self._reader = open(path, "rb")
+
+    def _set(self, key: str, hash_: str | None, status: str, offset: int):
+        previous = self.entries.get(key)
+        ok_offset = offset if status == "ok" else previous and previous["ok_offset"]
+        self.entries[key] = {"hash": hash_, "status": status, "offset": offset, "ok_offset": ok_offset}
+
+    def done(self, issue: dict) -> bool:
+        entry = self.entries.get(issue_key(issue))
+        return entry is not None and entry["status"] == "ok" and entry.get("hash") == issue_hash(issue)
+
+    def record(self, issue: dict, faqs: list | None = None, error: str | None = None):
+        entry = {
+            "key": issue_key(issue),
+            "hash": issue_hash(issue),
+            "status": "error" if error else "ok",
+            "faqs": faqs or [],
+            "error": error,
+            "ts": time.time(),
+        }
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self._set(entry["key"], entry["hash"], entry["status"], self._offset)
+        self._offset += len(data)
+
+    def issue_faqs(self, key: str) -> list[dict]:
+        """单条 Issue 最近一次成功生成的 FAQ（按偏移从日志读取），从未成功时返回空列表"""
+        entry = self.entries.get(key)
+        if entry is None or entry["ok_offset"] is None:
+            return []
+        self._reader.seek(entry["ok_offset"])
+        return json.loads(self._reader.readline())["faqs"]
+
+    def iter_faqs(self, issues: list[dict] | None = None, repos: list[str] | None = None) -> Iterator[dict]:
+        """
+        逐条产出 FAQ；传入 issues 时只返回这些 Issue 的结果
+        传入 repos 时只返回这些仓库的条目（键为 repo#number），不含无仓库名的旧键和其他仓库
+        """
+        keys = [issue_key(i) for i in issues] if issues is not None else list(self.entries)
+        if repos is not None:
+            prefixes = tuple(f"{repo}#" for repo in repos)
+            keys = [key for key in keys if key.startswith(prefixes)]
+        for key in keys:
+            yield from self.issue_faqs(key)
+
+    def faqs(self, issues: list[dict] | None = None, repos: list[str] | None = None) -> list[dict]:
+        return list(self.iter_faqs(issues, repos))
+
+    def close(self):
+        self._file.close()
+        self._reader.close()
+
+
+def parse_faqs(content: str) -> list[dict]:
+    """解析模型输出的 JSON 数组，兼容被 ```json 包裹的情况"""
+    content = content.strip()
+    fenced = re.search(r"```(?:json)?\s*([\s\S]*?)```", content)
+    if fenced:
+        content = fenced.group(1).strip()
+    faqs = json.loads(content)
+    if isinstance(faqs, dict):
+        faqs = [faqs]
+    return [f for f in faqs if isinstance(f, dict) and f.get("question")]
+
+
+async def _generate_one(issue: dict, limiter: AsyncRateLimiter, max_retries: int) -> list[dict]:
+    prompt = FAQ_PROMPT.format(
+        title=issue["title"], body=issue["body"], comments="; ".join(issue.get("comments") or [])
+    )
+    messages = [{"role": "user", "content": prompt}]
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            resp = await llm.ainvoke(messages)
+            return parse_faqs(resp.content)
+        except Exception:
+            if attempt >= max_retries:
+                raise
+            # 指数退避 + 抖动，应对限流与瞬时错误
+            await asyncio.sleep(min(2 ** attempt, 30) * (0.5 + random.random()))
+
+
+async def agenerate_faqs(
+    issues: list[dict],
+    journal_path: str = "data/faq_journal.jsonl",
+    concurrency: int = 8,
+    rate: float = 2.0,
+    max_retries: int = 2,
+) -> list[dict]:
+    """
+    并发地将 Issue 整理成 FAQ，每条结果写入 JSONL 日志
+    - concurrency: 同时进行的 LLM 请求数上限；rate: 每秒发起的请求数上限（令牌桶）
+    - 重新运行时跳过日志中已成功且内容未变的 Issue，只处理失败或缺失的部分
+    返回这些 Issue 的全部 FAQ（含此前已成功的）
+    """
+    journal = FaqJournal(journal_path)
+    pending = [i for i in issues if not journal.done(i)]
+    print(f"📝 共 {len(issues)} 条 Issue，已完成 {len(issues) - len(pending)} 条，待处理 {len(pending)} 条")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = AsyncRateLimiter(rate, burst=concurrency)
+    pbar = tqdm(total=len(pending), desc="🤖 生成 FAQ", unit="条", dynamic_ncols=True)
+    failed = 0
+
+    async def worker(issue: dict):
+        nonlocal failed
+        async with semaphore:
+            try:
+                faqs = await _generate_one(issue, limiter, max_retries)
+                faqs = [dict(faq, sources=[issue_source(issue)]) for faq in faqs]
+                journal.record(issue, faqs=faqs)
+            except Exception as e:
+                failed += 1
+                journal.record(issue, error=str(e))
+                tqdm.write(f"⚠️ Issue {issue['number']} 整理失败：{e}")
+            pbar.update(1)
+
+    try:
+        await asyncio.gather(*(worker(i) for i in pending))
+        if failed:
+            print(f"⚠️ {failed} 条 Issue 整理失败，重新运行将只重试这些 Issue")
+        return journal.faqs(issues)
+    finally:
+        pbar.close()
+        journal.close()
+
+
+async def astream_faqs(
+    issues: AsyncIterator[dict],
+    journal_path: str = "data/faq_journal.jsonl",
+    concurrency: int = 8,
+    rate: float = 2.0,
+    max_retries: int = 2,
+) -> AsyncIterator[dict]:
+    """
+    流式版本的 agenerate_faqs：边消费 Issue 边产出 FAQ
+    - 最多 concurrency 个 LLM 请求在途，槽位占满时暂停读取上游（背压），不会把全部 Issue 读进内存
+    - 日志中已成功且内容未变的 Issue 直接产出已有 FAQ
+    - 产出顺序为完成顺序，不保证与输入顺序一致
+    """
+    journal = FaqJournal(journal_path)
+    limiter = AsyncRateLimiter(rate, burst=concurrency)
+    stats = {"reused": 0, "generated": 0, "failed": 0}
+
+    async def work(issue: dict) -> list[dict]:
         try:
-            messages=[{"role": "user", "content": prompt}]
-            resp = llm.invoke(messages)
-            content = resp.content.strip()
-            faqs = json.loads(content)
-            all_faq.extend(faqs)
+            faqs = await _generate_one(issue, limiter, max_retries)
+            faqs = [dict(faq, sources=[issue_source(issue)]) for faq in faqs]
+            journal.record(issue, faqs=faqs)
+            stats["generated"] += 1
+            return faqs
         except Exception as e:
-            print(f"⚠️ Issue {issue['number']} 整理失败：{e}")
-            continue
-    
+            stats["failed"] += 1
+            journal.record(issue, error=str(e))
+            tqdm.write(f"⚠️ Issue {issue_key(issue)} 整理失败：{e}")
+            return journal.issue_faqs(issue_key(issue))  # 沿用最近一次成功的结果
+
+    pending: set[asyncio.Task] = set()
+    try:
+        async for issue in issues:
+            if journal.done(issue):
+                stats["reused"] += 1
+                for faq in journal.issue_faqs(issue_key(issue)):
+                    yield faq
+                continue
+            while len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for faq in task.result():
+                        yield faq
+            pending.add(asyncio.create_task(work(issue)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for faq in task.result():
+                    yield faq
+    finally:
+        for task in pending:
+            task.cancel()
+        journal.close()
+    print(f"📝 FAQ 流式生成：复用 {stats['reused']} 条 Issue，新生成 {stats['generated']} 条，失败 {stats['failed']} 条")
+
+
+def generate_issue_faq(issues: list[dict], output_file: str = "data/issues_faq.json", **kwargs):
+    """
+    使用 LLM 将每条 Issue 整理成 1-2 个 Q&A，包含解决步骤，并写入 JSON 文件
+    并发、限流与断点续跑参数见 agenerate_faqs
+    输出格式：
+    [
+        {
+            "question": "问题描述",
+            "steps": ["步骤1", "步骤2"],
+            "answer": "最终解决结果",
+        }
+    ]
+    """
+    all_faq = asyncio.run(agenerate_faqs(issues, **kwargs))
+
     # 去重
-    all_faq = llm_deduplicate_faqs(all_faq)
+    all_faq = deduplicate_faqs(all_faq)
 
     # 写入文件
     with open(output_file, "w", encoding="utf-8") as f:
@@ -68,32 +303,213 @@ def generate_issue_faq(issues: list[dict], output_file: str = "data/issues_faq.j
     return all_faq
 
 
-def llm_deduplicate_faqs(faqs: list[dict]):
+MERGE_PROMPT = """
+以下 FAQ 的问题描述相近，请判断哪些实际上是同一个问题：
+- 同一问题的条目合并为一条，合并各自的解决步骤（去掉重复步骤），answer 取最完整准确的结论
+- 不同问题的条目原样保留
+输出 **纯 JSON** 数组，每条包含 question、steps、answer，以及 merged_from（合并来源条目的编号列表），不要 Markdown 或多余文本
+
+FAQ 列表：
+{faqs}
+"""
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def groups(self) -> list[list[int]]:
+        groups: dict[int, list[int]] = {}
+        for i in range(len(self.parent)):
+            groups.setdefault(self.find(i), []).append(i)
+        return list(groups.values())
+
+
+def similar_pairs(
+    vectors: np.ndarray,
+    threshold: float,
+    exact_limit: int = 4096,
+    recall: float = 0.95,
+    tables: int | None = None,
+    seed: int = 0,
+):
     """
-    使用 LLM 去重 FAQ，合并重复问题的步骤和答案
+    返回余弦相似度不低于 threshold 的 (i, j, sim) 数组（i < j），vectors 需已归一化
+    - 条目数不超过 exact_limit 时分块计算完整相似度矩阵（精确）
+    - 更大时用随机超平面 LSH 分桶，只在桶内计算相似度，整体接近线性（近似）
+      相似度恰为 threshold 的一对在单表中同桶的概率为 p = (1 - arccos(threshold) / π) ^ bits，
+      多表召回率为 1 - (1 - p) ^ tables；tables 不传时按目标 recall 计算，
+      如 threshold=0.85、12 位时约需 30 张表，相似度更高的对召回率更高
     """
+    n = len(vectors)
+    found: dict[tuple[int, int], float] = {}
 
-    prompt = f"""
-    你是一个帮助整理 FAQ 的助手。  
-我有一个 FAQ 列表，每条 FAQ 包含：
+    def collect(index: np.ndarray):
+        sub = vectors[index]
+        for start in range(0, len(index), 1024):
+            sims = sub[start:start + 1024] @ sub.T
+            rows, cols = np.nonzero(sims >= threshold)
+            for r, c in zip(rows, cols):
+                i, j = int(index[start + r]), int(index[c])
+                if i < j:
+                    found[(i, j)] = float(sims[r, c])
 
-- question: 问题描述
-- steps: 可执行的解决步骤列表
-- answer: 最终解决结果
+    if n <= exact_limit:
+        collect(np.arange(n))
+    else:
+        rng = np.random.default_rng(seed)
+        # 平均每桶约 64 条；位数过多时单表同桶概率太低，需要的表数急剧增加
+        bits = min(max(int(np.log2(n)) - 6, 6), 12)
+        if tables is None:
+            p = (1 - np.arccos(np.clip(threshold, -1, 1)) / np.pi) ** bits
+            tables = int(np.ceil(np.log(1 - recall) / np.log(1 - p))) if p < 1 else 1
+        weights = 1 << np.arange(bits, dtype=np.int64)
+        for _ in range(tables):
+            planes = rng.standard_normal((vectors.shape[1], bits)).astype(np.float32)
+            codes = ((vectors @ planes) > 0).astype(np.int64) @ weights
+            order = np.argsort(codes, kind="stable")
+            boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+            for bucket in np.split(order, boundaries):
+                if len(bucket) > 1:
+                    collect(bucket)
+    return [(i, j, sim) for (i, j), sim in found.items()]
 
-请帮我去掉重复或高度相似的 FAQ，保留每组相似 FAQ 的最优条目，要求：
 
-1. 输出格式为 **纯 JSON** 数组
-2. 每条 FAQ 保留原有字段：question, steps, answer
-3. 不要 Markdown 包裹或多余说明
+def _richness(faq: dict) -> int:
+    """条目完整度：步骤数优先，其次答案长度"""
+    return len(faq.get("steps") or []) * 1000 + len(faq.get("answer") or "")
+
+
+def _merge_sources(target: dict, faqs: list[dict]) -> dict:
+    """合并来源字段（如 sources），保留来源信息"""
+    sources = {json.dumps(s, sort_keys=True, ensure_ascii=False): s for f in faqs for s in f.get("sources", [])}
+    if sources:
+        target["sources"] = list(sources.values())
+    return target
+
+
+def _cluster_key(cluster: list[dict]) -> str:
+    """相似簇的内容指纹，作为 LLM 合并结果的缓存键"""
+    return hashlib.sha256(json.dumps(cluster, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def _llm_merge(cluster: list[dict], limiter: AsyncRateLimiter) -> list[dict]:
+    """小批量 LLM 合并一个相似簇；失败时原样保留"""
+    listing = json.dumps(
+        [{"id": i, "question": f["question"], "steps": f.get("steps", []), "answer": f.get("answer", "")}
+         for i, f in enumerate(cluster)],
+        ensure_ascii=False,
+    )
+    await limiter.acquire()
+    try:
+        resp = await llm.ainvoke([{"role": "user", "content": MERGE_PROMPT.format(faqs=listing)}])
+        merged = parse_faqs(resp.content)
+    except Exception as e:
+        tqdm.write(f"⚠️ 相似簇合并失败，保留原条目：{e}")
+        return cluster
+    # 校验模型输出：每个输入条目都必须出现在某条结果的 merged_from 中
+    questions = {f["question"]: i for i, f in enumerate(cluster)}
+    result, covered = [], set()
+    for faq in merged:
+        ids = faq.pop("merged_from", None)
+        ids = [i for i in ids if isinstance(i, int) and 0 <= i < len(cluster)] if isinstance(ids, list) else []
+        if not ids and faq["question"] in questions:
+            ids = [questions[faq["question"]]]  # 未给出来源但问题与某条输入一致，视为原样保留
+        if not ids:
+            continue  # 无法确定来源的结果丢弃，对应输入会在下面原样补回
+        covered.update(ids)
+        result.append(_merge_sources(faq, [cluster[i] for i in dict.fromkeys(ids)]))
+    missing = [f for i, f in enumerate(cluster) if i not in covered]
+    if missing:
+        tqdm.write(f"⚠️ 相似簇合并结果遗漏 {len(missing)} 条，已原样保留")
+    return result + missing
 
-FAQ 列表：
-{faqs}
 
+async def adeduplicate_faqs(
+    faqs: list[dict],
+    embeddings=None,
+    merge_threshold: float = 0.95,
+    candidate_threshold: float = 0.85,
+    max_cluster_size: int = 10,
+    concurrency: int = 4,
+    rate: float = 2.0,
+    merge_cache: dict | None = None,
+) -> list[dict]:
     """
-    messages=[{"role": "user", "content": prompt}]
-    resp = llm.invoke(messages)
-    content = resp.content.strip()
-    print(content)
-    faqs = json.loads(content)
-    return faqs
\ No newline at end of file
+    基于向量的 FAQ 去重
+    - 用 LocalEmbeddings 计算问题向量，按相似度阈值找出近重复对（大语料用 LSH 分桶，接近线性）
+    - 相似度 >= merge_threshold 的条目直接合并，保留最完整的一条
+    - candidate_threshold ~ merge_threshold 之间的模糊簇交给 LLM 判断，每个簇一个小 Prompt
+    - merge_cache: 簇指纹 -> LLM 合并结果，簇未变化时直接复用，增量同步不重复调用 LLM；
+      运行结束后只保留本次用到的簇
+    """
+    if len(faqs) < 2:
+        return faqs
+    embeddings = embeddings or LocalEmbeddings("BAAI/bge-small-zh")
+    vectors = np.asarray(embeddings.embed_documents([f["question"] for f in faqs]), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    pairs = similar_pairs(vectors, candidate_threshold)
+    strong, loose = _UnionFind(len(faqs)), _UnionFind(len(faqs))
+    for i, j, sim in pairs:
+        loose.union(i, j)
+        if sim >= merge_threshold:
+            strong.union(i, j)
+
+    # 高相似直接合并：每个强连通组保留最完整的条目
+    representative = {}
+    for group in strong.groups():
+        best = max(group, key=lambda i: _richness(faqs[i]))
+        representative[strong.find(best)] = _merge_sources(dict(faqs[best]), [faqs[i] for i in group])
+
+    result, ambiguous = [], []
+    for group in loose.groups():
+        reps = [representative[root] for root in dict.fromkeys(strong.find(i) for i in group)]
+        if len(reps) == 1 or len(reps) > max_cluster_size:
+            result.extend(reps)  # 过大的簇不适合小 Prompt，保留各组代表
+        else:
+            ambiguous.append(reps)
+
+    limiter = AsyncRateLimiter(rate, burst=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    cache = dict(merge_cache or {})
+    used = {}
+
+    async def merge(cluster):
+        key = _cluster_key(cluster)
+        if key not in cache:
+            async with semaphore:
+                merged = await _llm_merge(cluster, limiter)
+            if merged is cluster:
+                return merged  # 合并失败不缓存，下次重试
+            cache[key] = merged
+        used[key] = cache[key]
+        return cache[key]
+
+    for merged in await asyncio.gather(*(merge(c) for c in ambiguous)):
+        result.extend(merged)
+    if merge_cache is not None:
+        merge_cache.clear()
+        merge_cache.update(used)
+    print(
+        f"🧹 FAQ 去重：{len(faqs)} -> {len(result)} 条"
+        f"（直接合并 {len(faqs) - len(representative)} 条，LLM 判断 {len(ambiguous)} 个相似簇）"
+    )
+    return result
+
+
+def deduplicate_faqs(faqs: list[dict], **kwargs) -> list[dict]:
+    """adeduplicate_faqs 的同步包装"""
+    return asyncio.run(adeduplicate_faqs(faqs, **kwargs))
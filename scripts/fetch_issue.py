@@ -1,16 +1,27 @@
+import asyncio
 import os
 import time
 from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator
 from github import Github, Auth, RateLimitExceededException
 from tqdm import tqdm
 from dotenv import load_dotenv
+from core.github_client import GitHubClient
 
 load_dotenv(".env")
 
-def fetch_github_issues(repo_name: str, max_issues: int = 50, token: str = None):
+def iter_github_issues(
+    repo_name: str,
+    max_issues: int | None = 50,
+    token: str = None,
+    since: datetime | None = None,
+    sort: str = "created",
+    direction: str = "desc",
+) -> Iterator[dict]:
     """
-    拉取 GitHub Issues（含标题、正文、评论）
-    - max_issues: 外部调用控制抓取总条数
+    逐条拉取 GitHub Issues（含标题、正文、评论），边拉取边产出，内存占用不随仓库大小增长
+    - max_issues: 外部调用控制抓取总条数，None 表示不限
+    - since: 只拉取该时间之后有更新的 Issue（增量同步用）
     - 自动处理速率限制
     - 过滤 PR
     - 避免重复
@@ -21,17 +32,20 @@ def fetch_github_issues(repo_name: str, max_issues: int = 50, token: str = None)
 
     g = Github(auth=Auth.Token(token))
     repo = g.get_repo(repo_name)
-    all_issues = []
     seen_numbers = set()
     total_fetched = 0
 
-    tqdm.write(f"🔍 正在拉取仓库 {repo_name} 的 Issues（最多 {max_issues} 条）...")
+    tqdm.write(
+        f"🔍 正在拉取仓库 {repo_name} 的 Issues（最多 {max_issues or '不限'} 条"
+        + (f"，{since.isoformat()} 之后更新" if since else "") + "）..."
+    )
 
-    issues_iterator = repo.get_issues(state="all", direction="desc", sort="created")
+    kwargs = {"since": since} if since else {}
+    issues_iterator = repo.get_issues(state="all", direction=direction, sort=sort, **kwargs)
     pbar = tqdm(desc="📥 拉取 Issues", unit="条", dynamic_ncols=True)
 
     for issue in issues_iterator:
-        if total_fetched >= max_issues:
+        if max_issues is not None and total_fetched >= max_issues:
             break
         if getattr(issue, "pull_request", None):  # 过滤 PR
             continue
@@ -40,7 +54,8 @@ def fetch_github_issues(repo_name: str, max_issues: int = 50, token: str = None)
 
         while True:
             try:
-                comments = [c.body for c in issue.get_comments()]
+                # 无评论时省掉一次请求
+                comments = [c.body for c in issue.get_comments()] if issue.comments else []
                 break
             except RateLimitExceededException:
                 reset_time = g.get_rate_limit().core.reset
@@ -48,23 +63,219 @@ def fetch_github_issues(repo_name: str, max_issues: int = 50, token: str = None)
                 tqdm.write(f"🚦 触发速率限制，等待 {int(sleep_seconds)} 秒后重试")
                 time.sleep(sleep_seconds)
 
-        text = f"# {issue.title}\n\n{issue.body or ''}\n\n" + "\n".join(comments)
-        all_issues.append({
+        seen_numbers.add(issue.number)
+        total_fetched += 1
+        pbar.set_postfix({"已拉取": total_fetched})
+        pbar.update(1)
+        yield {
+            "repo": repo_name,
             "number": issue.number,
+            "updated_at": _iso_utc(issue.updated_at),
             "title": issue.title,
             "body": issue.body,
             "comments": comments,
-            "content": text,
-        })
-        seen_numbers.add(issue.number)
+        }
 
-        total_fetched += 1
-        pbar.set_postfix({"已拉取": total_fetched})
-        pbar.update(1)
+    pbar.close()
+    tqdm.write(f"📦 已拉取 {total_fetched} 条有效 Issue")
+
+
+def fetch_github_issues(repo_name: str, max_issues: int | None = 50, token: str = None, **kwargs) -> list[dict]:
+    """一次性拉取全部结果，参数见 iter_github_issues"""
+    return list(iter_github_issues(repo_name, max_issues=max_issues, token=token, **kwargs))
 
+
+ISSUES_QUERY = """
+query($owner: String!, $name: String!, $first: Int!, $after: String, $since: DateTime,
+      $field: IssueOrderField!, $direction: OrderDirection!, $comments: Int!) {
+  rateLimit { cost remaining resetAt }
+  repository(owner: $owner, name: $name) {
+    issues(first: $first, after: $after, filterBy: {since: $since},
+           orderBy: {field: $field, direction: $direction}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number title body updatedAt
+        comments(first: $comments) {
+          pageInfo { hasNextPage endCursor }
+          nodes { body }
+        }
+      }
+    }
+  }
+}
+"""
+
+COMMENTS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $after: String) {
+  rateLimit { cost remaining resetAt }
+  repository(owner: $owner, name: $name) {
+    issue(number: $number) {
+      comments(first: 100, after: $after) {
+        pageInfo { hasNextPage endCursor }
+        nodes { body }
+      }
+    }
+  }
+}
+"""
+
+
+def _iso_utc(value: datetime | str | None) -> str | None:
+    """统一成带时区的 ISO 时间，与 REST 后端的 updated_at 格式一致，便于比较水位线"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+async def aiter_github_issues_graphql(
+    client: GitHubClient,
+    repo_name: str,
+    max_issues: int | None = 50,
+    since: datetime | None = None,
+    sort: str = "created",
+    direction: str = "desc",
+    page_size: int = 50,
+) -> AsyncIterator[dict]:
+    """
+    用 GraphQL 批量拉取 Issues，每页同时带回前 100 条评论，逐页产出，内存中最多保留一页
+    - 评论超过 100 条的 Issue 再按游标补拉，其余 Issue 不需要额外请求
+    - issues 连接本身不包含 PR
+    产出格式与 iter_github_issues 相同
+    """
+    owner, name = repo_name.split("/", 1)
+    variables = {
+        "owner": owner,
+        "name": name,
+        "since": _iso_utc(since),
+        "field": "UPDATED_AT" if sort == "updated" else "CREATED_AT",
+        "direction": direction.upper(),
+        "comments": 100,
+        "after": None,
+    }
+    total_fetched = 0
+    pbar = tqdm(desc=f"📥 拉取 {repo_name}", unit="条", dynamic_ncols=True)
+    while max_issues is None or total_fetched < max_issues:
+        first = page_size if max_issues is None else min(page_size, max_issues - total_fetched)
+        data = await client.graphql(ISSUES_QUERY, dict(variables, first=first))
+        connection = data["repository"]["issues"]
+        for node in connection["nodes"]:
+            comments = [c["body"] for c in node["comments"]["nodes"]]
+            page = node["comments"]["pageInfo"]
+            while page["hasNextPage"]:
+                more = await client.graphql(
+                    COMMENTS_QUERY, {"owner": owner, "name": name, "number": node["number"], "after": page["endCursor"]}
+                )
+                more = more["repository"]["issue"]["comments"]
+                comments.extend(c["body"] for c in more["nodes"])
+                page = more["pageInfo"]
+
+            total_fetched += 1
+            pbar.update(1)
+            yield {
+                "repo": repo_name,
+                "number": node["number"],
+                "updated_at": _iso_utc(node["updatedAt"]),
+                "title": node["title"],
+                "body": node["body"],
+                "comments": comments,
+            }
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        variables["after"] = connection["pageInfo"]["endCursor"]
     pbar.close()
-    tqdm.write(f"📦 已拉取 {len(all_issues)} 条有效 Issue")
-    return all_issues
+    tqdm.write(f"📦 {repo_name}：已拉取 {total_fetched} 条有效 Issue")
+
+
+async def afetch_github_issues_graphql(client: GitHubClient, repo_name: str, **kwargs) -> list[dict]:
+    """一次性拉取全部结果，参数见 aiter_github_issues_graphql"""
+    return [issue async for issue in aiter_github_issues_graphql(client, repo_name, **kwargs)]
+
+
+def _github_token(token: str | None) -> str:
+    token = token or os.getenv("GITHUB_TOKEN")
+    if not token:
+        raise ValueError("❌ 请在 .env 文件中配置 GITHUB_TOKEN 或传入 token 参数")
+    return token
+
+
+async def afetch_issues_graphql(repos: dict[str, datetime | None], token: str = None, **kwargs) -> dict[str, list[dict]]:
+    """
+    并发拉取多个仓库，共享一个连接池和速率配额
+    - repos: 仓库名 -> since（None 表示全量）
+    """
+    client = GitHubClient(_github_token(token), timeout=30.0)
+    try:
+        results = await asyncio.gather(
+            *(afetch_github_issues_graphql(client, repo, since=since, **kwargs) for repo, since in repos.items())
+        )
+    finally:
+        await client.aclose()
+    stats = client.stats
+    tqdm.write(f"📊 GraphQL 请求 {stats['graphql_requests']} 次，消耗配额 {stats['graphql_cost']} 点")
+    return dict(zip(repos, results))
+
+
+def fetch_issues(repos: dict[str, datetime | None], backend: str = "rest", token: str = None, **kwargs) -> dict[str, list[dict]]:
+    """
+    按后端拉取多个仓库的 Issues
+    - rest: PyGithub 逐仓库拉取，每条 Issue 一次评论请求
+    - graphql: 批量分页拉取 Issue 与评论，多个仓库并发，请求数少一到两个数量级
+    """
+    if backend == "graphql":
+        return asyncio.run(afetch_issues_graphql(repos, token=token, **kwargs))
+    kwargs.pop("page_size", None)
+    return {repo: fetch_github_issues(repo, token=token, since=since, **kwargs) for repo, since in repos.items()}
+
+
+async def aiter_issues(
+    repos: dict[str, datetime | None],
+    backend: str = "graphql",
+    token: str = None,
+    queue_size: int = 64,
+    **kwargs,
+) -> AsyncIterator[dict]:
+    """
+    流式拉取多个仓库的 Issues，各仓库并发拉取，经有界队列合并成一个异步流
+    - 下游消费慢时队列写满，拉取自动暂停（背压），内存占用不随仓库大小增长
+    - rest 后端的同步迭代在线程中推进，不阻塞事件循环
+    - 任一仓库拉取失败时异常会在消费端抛出
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    done = object()
+    client = GitHubClient(_github_token(token), timeout=30.0) if backend == "graphql" else None
+    if client is None:
+        kwargs.pop("page_size", None)
+
+    async def produce(repo: str, since: datetime | None):
+        if client is not None:
+            async for issue in aiter_github_issues_graphql(client, repo, since=since, **kwargs):
+                await queue.put(issue)
+            return
+        issues = iter_github_issues(repo, token=token, since=since, **kwargs)
+        while (issue := await asyncio.to_thread(next, issues, None)) is not None:
+            await queue.put(issue)
+
+    async def produce_all():
+        try:
+            await asyncio.gather(*(produce(repo, since) for repo, since in repos.items()))
+            await queue.put(done)
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.create_task(produce_all())
+    try:
+        while (item := await queue.get()) is not done:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+        if client is not None:
+            await client.aclose()
 
 
 from scripts.faq import generate_issue_faq
@@ -72,7 +283,8 @@ from scripts.faq import generate_issue_faq
 
 if __name__ == "__main__":
     repo_name = "OpenCSGs/csghub"
-    issues = fetch_github_issues(repo_name, max_issues=2)
+    backend = os.getenv("FETCH_BACKEND", "rest")
+    issues = fetch_issues({repo_name: None}, backend=backend, max_issues=2)[repo_name]
     print(f"最终抓取有效 Issue 数量: {len(issues)}")
     faqs = generate_issue_faq(issues)
 
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Callable, Iterator
+
+from scripts.build import build_index_version
+from scripts.faq import FaqJournal, astream_faqs, issue_key
+from scripts.fetch_issue import aiter_issues
+
+# 与 sync 的索引目录（data/chroma_db）分开，两者各自发布版本、清理旧版本，共用会互相覆盖
+PIPELINE_INDEX_ROOT = "data/pipeline_index"
+
+_DONE = object()
+
+
+async def _pump(source: AsyncIterator, queue: asyncio.Queue, sink: Callable | None = None):
+    """把异步流写入有界队列；结束时放入 _DONE，出错时放入异常，由消费端抛出"""
+    try:
+        async for item in source:
+            if sink is not None:
+                sink(item)
+            await queue.put(item)
+        await queue.put(_DONE)
+    except Exception as e:
+        await queue.put(e)
+
+
+async def _seen(issues: AsyncIterator[dict], keys: set) -> AsyncIterator[dict]:
+    """透传 Issue 流并记录经过的键"""
+    async for issue in issues:
+        keys.add(issue_key(issue))
+        yield issue
+
+
+async def _with_journal(
+    faqs: AsyncIterator[dict], seen: set, journal_path: str, repos: list[str]
+) -> AsyncIterator[dict]:
+    """
+    先产出本次拉取 Issue 的 FAQ，再从 FAQ 日志补齐这些仓库中本次未拉取的 Issue
+    索引构建会删除输入中没有的条目，只喂增量时 since、max_issues 或拉取中断都会让已有 FAQ 从索引中消失
+    """
+    async for faq in faqs:
+        yield faq
+    journal = FaqJournal(journal_path)
+    try:
+        for key in list(journal.entries):
+            if key in seen or not key.startswith(tuple(f"{repo}#" for repo in repos)):
+                continue
+            for faq in journal.issue_faqs(key):
+                yield faq
+    finally:
+        journal.close()
+
+
+def _blocking_iter(queue: asyncio.Queue, loop: asyncio.AbstractEventLoop) -> Iterator:
+    """在工作线程中同步消费事件循环里的队列，供同步的索引构建阶段使用"""
+    while True:
+        item = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def _abort(queue: asyncio.Queue):
+    """清空队列并放入异常，让阻塞在队列上的工作线程退出"""
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(RuntimeError("流水线已取消"))
+
+
+async def arun_pipeline(
+    repos: dict,
+    faq_file: str = "data/issues_faq.jsonl",
+    index_root: str = PIPELINE_INDEX_ROOT,
+    fetch_backend: str = "graphql",
+    journal_path: str = "data/faq_journal.jsonl",
+    max_issues: int | None = None,
+    queue_size: int = 64,
+    concurrency: int = 8,
+    rate: float = 2.0,
+    keep: int = 3,
+    **build_kwargs,
+) -> str | None:
+    """
+    流式流水线：拉取 Issue -> 生成 FAQ -> 向量化并构建索引，三个阶段同时运行
+    - 阶段之间是有界队列（queue_size），下游慢时上游暂停，峰值内存不随仓库大小增长
+    - FAQ 阶段的 LLM 请求与拉取、向量化重叠进行；已在 FAQ 日志中且内容未变的 Issue 不再调用 LLM
+    - 生成的 FAQ 同时逐行写入 faq_file（JSONL），完成后原子替换，可供 build / sync 复用
+    - 索引在新版本目录中增量构建（按 FAQ 内容哈希复用未变化的向量），任一阶段失败时不发布
+    - 构建的输入是完整语料：本次拉取的 Issue 之外，repos 中其余 Issue 的 FAQ 从日志补齐，
+      因此 since、max_issues 或生成失败不会删除索引中已有的条目
+    - repos: 仓库名 -> since（None 表示全量）；近重复 FAQ 的合并仍由 sync / generate_issue_faq 批量完成
+    - index_root 默认 data/pipeline_index，不能与 sync 共用同一目录；服务端设置 INDEX_ROOT=data/pipeline_index 后
+      检索该索引（此时索引中的 FAQ 未做近重复合并），默认仍检索 sync 发布的 data/chroma_db
+    返回新发布的索引版本，无变化时返回 None
+    """
+    loop = asyncio.get_running_loop()
+    faq_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    if os.path.dirname(faq_file):
+        os.makedirs(os.path.dirname(faq_file), exist_ok=True)
+    out = open(faq_file + ".tmp", "w", encoding="utf-8")
+
+    def tee(faq: dict):
+        out.write(json.dumps(faq, ensure_ascii=False) + "\n")
+
+    seen: set[str] = set()
+    issues = aiter_issues(repos, backend=fetch_backend, queue_size=queue_size, max_issues=max_issues)
+    faqs = astream_faqs(_seen(issues, seen), journal_path=journal_path, concurrency=concurrency, rate=rate)
+    faqs = _with_journal(faqs, seen, journal_path, list(repos))
+    producer = asyncio.create_task(_pump(faqs, faq_queue, tee))
+    try:
+        version = await asyncio.to_thread(
+            build_index_version, _blocking_iter(faq_queue, loop), index_root, keep=keep, **build_kwargs
+        )
+        await producer
+    except BaseException:
+        producer.cancel()
+        _abort(faq_queue)
+        out.close()
+        os.remove(faq_file + ".tmp")
+        raise
+    out.close()
+    os.replace(faq_file + ".tmp", faq_file)
+    print(f"✅ 流水线完成，FAQ 已写入 {faq_file}")
+    return version
+
+
+def run_pipeline(repos: list[str] | dict, **kwargs) -> str | None:
+    """arun_pipeline 的同步入口；repos 传列表时全部全量拉取"""
+    if not isinstance(repos, dict):
+        repos = {repo: None for repo in repos}
+    return asyncio.run(arun_pipeline(repos, **kwargs))
+
+
+if __name__ == "__main__":
+    run_pipeline(
+        [r.strip() for r in os.getenv("PIPELINE_REPOS", "OpenCSGs/csghub").split(",") if r.strip()],
+        faq_file=os.getenv("FAQ_FILE", "data/issues_faq.jsonl"),
+        index_root=os.getenv("PIPELINE_INDEX_ROOT", PIPELINE_INDEX_ROOT),
+        fetch_backend=os.getenv("FETCH_BACKEND", "graphql"),
+        max_issues=int(os.getenv("PIPELINE_MAX_ISSUES", "0")) or None,
+        queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "64")),
+        concurrency=int(os.getenv("FAQ_CONCURRENCY", "8")),
+        rate=float(os.getenv("FAQ_RATE", "2.0")),
+        keep=int(os.getenv("INDEX_KEEP_VERSIONS", "3")),
+        index_type=os.getenv("INDEX_TYPE", "chroma"),
+        workers=int(os.getenv("BUILD_WORKERS", "0")) or None,
+        batch_size=int(os.getenv("BUILD_BATCH_SIZE", "64")),
+        backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        dtype=os.getenv("INDEX_DTYPE", "float32"),
+    )
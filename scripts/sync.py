@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+
+from scripts.build import build_index_version, chroma_db_path
+from scripts.faq import FaqJournal, agenerate_faqs, deduplicate_faqs
+from scripts.fetch_issue import fetch_issues
+
+SYNC_STATE_FILE = "data/sync_state.json"
+MERGE_CACHE_FILE = "data/faq_merge_cache.json"
+
+
+def load_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, data, indent: int | None = None):
+    """先写临时文件再原子替换，中途失败时保留上一次的内容"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(path + ".tmp", path)
+
+
+def high_water_mark(issues: list[dict], failed: list[dict], previous: str | None) -> str | None:
+    """
+    本次同步后的水位线：已处理 Issue 中最新的 updated_at
+    有 FAQ 生成失败的 Issue 时停在其中最早的 updated_at，下次同步会重新拉取并重试
+    """
+    failed_marks = [i["updated_at"] for i in failed if i.get("updated_at")]
+    if failed_marks:
+        return min(failed_marks)
+    marks = [i["updated_at"] for i in issues if i.get("updated_at")]
+    return max(marks + ([previous] if previous else [])) if marks else previous
+
+
+def sync(
+    repos: list[str],
+    faq_file: str = "data/issues_faq.json",
+    index_root: str = chroma_db_path,
+    state_file: str = SYNC_STATE_FILE,
+    journal_path: str = "data/faq_journal.jsonl",
+    merge_cache_file: str = MERGE_CACHE_FILE,
+    max_issues: int | None = None,
+    fetch_backend: str = "rest",
+    concurrency: int = 8,
+    rate: float = 2.0,
+    keep: int = 3,
+    **build_kwargs,
+) -> str | None:
+    """
+    增量同步 Issue -> FAQ -> 索引
+    - 按仓库记录水位线（updated_at），只拉取上次同步之后有更新的 Issue；fetch_backend 见 fetch_issues
+    - 只为这些 Issue 重新生成 FAQ（FAQ 日志按内容指纹跳过未变化的 Issue），其余 Issue 的 FAQ 从日志复用
+    - 索引只包含 repos 中仓库的 FAQ；生成失败的 Issue 沿用日志中最近一次成功的 FAQ
+    - 去重复用 LLM 合并缓存，索引构建按 FAQ 内容哈希只更新变化的条目
+    - 索引发布成功后才推进水位线，中途失败时下次同步从原水位线重来
+    返回新发布的索引版本，无变化时返回 None
+    """
+    state = load_json(state_file, {})
+    since = {repo: state.get(repo, {}).get("since") for repo in repos}
+    # 按更新时间升序拉取，max_issues 截断时下次从截断处继续
+    marks = fetch_issues(
+        {repo: datetime.fromisoformat(s) if s else None for repo, s in since.items()},
+        backend=fetch_backend,
+        max_issues=max_issues,
+        sort="updated",
+        direction="asc",
+    )
+    updated = []
+    for repo, issues in marks.items():
+        print(f"🔄 {repo}：{len(issues)} 条 Issue 自 {since[repo] or '首次同步'} 以来有更新")
+        updated.extend(issues)
+
+    # since 包含边界，上次最后一条会被重复拉取；标签等变化也会更新 updated_at，只有内容变化的 Issue 才需要重新生成
+    journal = FaqJournal(journal_path)
+    changed = [i for i in updated if not journal.done(i)]
+    journal.close()
+    if changed:
+        asyncio.run(agenerate_faqs(changed, journal_path=journal_path, concurrency=concurrency, rate=rate))
+
+    journal = FaqJournal(journal_path)
+    try:
+        failed = [i for i in updated if not journal.done(i)]
+        all_faq = journal.faqs(repos=repos)
+    finally:
+        journal.close()
+
+    version = None
+    if changed or not os.path.exists(faq_file):
+        merge_cache = load_json(merge_cache_file, {})
+        all_faq = deduplicate_faqs(all_faq, merge_cache=merge_cache)
+        save_json(merge_cache_file, merge_cache)
+        save_json(faq_file, all_faq, indent=2)
+        print(f"✅ FAQ 共 {len(all_faq)} 条，保存至 {faq_file}")
+        version = build_index_version(faq_file, index_root, keep=keep, **build_kwargs)
+
+    now = datetime.now(timezone.utc).isoformat()
+    for repo, issues in marks.items():
+        previous = state.get(repo, {}).get("since")
+        repo_failed = [i for i in failed if i.get("repo") == repo]
+        state[repo] = {"since": high_water_mark(issues, repo_failed, previous), "synced_at": now}
+    save_json(state_file, state, indent=2)
+    if failed:
+        print(f"⚠️ {len(failed)} 条 Issue 的 FAQ 生成失败，水位线停在其中最早的更新时间，下次同步重试")
+    return version
+
+
+if __name__ == "__main__":
+    sync(
+        [r.strip() for r in os.getenv("SYNC_REPOS", "OpenCSGs/csghub").split(",") if r.strip()],
+        faq_file=os.getenv("FAQ_FILE", "data/issues_faq.json"),
+        max_issues=int(os.getenv("SYNC_MAX_ISSUES", "0")) or None,
+        fetch_backend=os.getenv("FETCH_BACKEND", "rest"),
+        concurrency=int(os.getenv("FAQ_CONCURRENCY", "8")),
+        rate=float(os.getenv("FAQ_RATE", "2.0")),
+        keep=int(os.getenv("INDEX_KEEP_VERSIONS", "3")),
+        index_type=os.getenv("INDEX_TYPE", "chroma"),
+        workers=int(os.getenv("BUILD_WORKERS", "0")) or None,
+        batch_size=int(os.getenv("BUILD_BATCH_SIZE", "64")),
+        backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        dtype=os.getenv("INDEX_DTYPE", "float32"),
+    )
@@ -1,22 +1,30 @@
-from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from graphs.issue_graph import build_issue_graph
 from core.issue_state import IssueState
+from core.resources import get_resources
+from core.job_queue import JobQueue, QueueFullError
+from core.github_client import GitHubClient
+from core.llm_cache import get_llm_cache
+from core.index_store import current_version
 from dotenv import load_dotenv
+import asyncio
 import time
-import requests
 import os
 
-from agents.review_agent import review_agent
+from agents.review_agent import review_agent, review_pool
 
 # === 初始化环境 ===
 load_dotenv(".env")
 
 app = FastAPI(title="Issue Assistant Webhook")
-graph = build_issue_graph()
+resources = get_resources()
+graph = build_issue_graph(resources, speculative=os.getenv("SPECULATIVE_RETRIEVAL", "0") == "1")
 
 # === GitHub Access Token（必须配置）===
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+github = GitHubClient(GITHUB_TOKEN)
 
 class IssueWebhook(BaseModel):
     action: str
@@ -25,28 +33,26 @@ class IssueWebhook(BaseModel):
     sender: dict
 
 
-def fetch_issue_comments(repo_full_name: str, issue_number: int):
-    """拉取 Issue 评论"""
-    url = f"https://api.github.com/repos/{repo_full_name}/issues/{issue_number}/comments"
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-    try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        comments_data = resp.json()
-        # 提取文本内容
-        return [c["body"] for c in comments_data if "body" in c]
-    except Exception as e:
-        print(f"⚠️ 拉取评论失败: {e}")
-        return []
+async def fetch_issue_comments(repo_full_name: str, issue_number: int):
+    """
+    拉取 Issue 评论（共享连接池 + 分页 + 条件请求）
+    失败时直接抛出，由任务队列退避重试；不能当作空评论处理，否则会被预分类为新建 Issue
+    """
+    comments_data = await github.get_issue_comments(repo_full_name, issue_number)
+    # 提取文本内容
+    return [c["body"] for c in comments_data if c.get("body")]
 
 
 async def process_issue(issue_state: IssueState):
     """后台执行的Graph处理逻辑"""
     print(f"⚙️ 开始后台处理 Issue #{issue_state['issue_id']}")
     start = time.time()
+
+    # 在执行时才拉取评论，保证合并后的任务基于最新的讨论内容
+    comments = await fetch_issue_comments(issue_state["repo_full_name"], int(issue_state["issue_id"]))
+    print(f"💬 拉取到 {len(comments)} 条评论")
+    issue_state["comments"] = comments
+
     result = await graph.ainvoke(issue_state)
     print(f"✅ 处理完成，耗时 {time.time() - start:.2f}s")
     print(f"🔄 上下文: {issue_state}")
@@ -64,8 +70,78 @@ async def process_issue(issue_state: IssueState):
 
 
 
+job_queue = JobQueue(
+    handler=process_issue,
+    db_path=os.getenv("ISSUE_QUEUE_DB", "data/jobs.db"),
+    workers=int(os.getenv("ISSUE_QUEUE_WORKERS", "4")),
+    max_attempts=int(os.getenv("ISSUE_QUEUE_MAX_ATTEMPTS", "3")),
+    max_depth=int(os.getenv("ISSUE_QUEUE_MAX_DEPTH", "0")) or None,
+)
+
+# 同一 Issue 的事件防抖窗口（秒），窗口内的连续评论合并为一次处理
+DEBOUNCE_SECONDS = float(os.getenv("ISSUE_DEBOUNCE_SECONDS", "10"))
+
+# 索引 CURRENT 指针的检查间隔（秒），0 表示只通过 /admin/reload-index 手动热加载
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "30"))
+# 管理接口令牌，配置后请求需携带 X-Admin-Token 头
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    watch_task = getattr(app.state, "index_watch_task", None)
+    if watch_task:
+        watch_task.cancel()
+    await job_queue.stop()
+    await github.aclose()
+    await review_pool.stop()
+
+
+@app.on_event("startup")
+async def start_review_pool():
+    """后台打开 MCP 会话池，MCP server 子进程启动较慢，不阻塞服务启动"""
+    app.state.review_pool_task = asyncio.create_task(review_pool.start())
+
+
+@app.on_event("startup")
+async def warm_up_resources():
+    """启动时在后台线程预热模型与向量库，不阻塞服务启动"""
+    async def _warm_up():
+        try:
+            await asyncio.to_thread(resources.warm_up)
+        except Exception:
+            pass  # 失败状态已记录在 resources.status() 中
+
+    app.state.warm_up_task = asyncio.create_task(_warm_up())
+
+
+@app.on_event("startup")
+async def watch_index():
+    """定期检查索引的 CURRENT 指针，发布新版本后在后台线程加载并原子切换"""
+    if INDEX_WATCH_INTERVAL <= 0:
+        return
+
+    async def _watch():
+        while True:
+            await asyncio.sleep(INDEX_WATCH_INTERVAL)
+            # 预热完成前不切换，预热本身会加载当前版本
+            if not resources.ready or current_version(resources.persist_dir) == resources.index_version:
+                continue
+            try:
+                await asyncio.to_thread(resources.reload_retriever)
+            except Exception as e:
+                print(f"⚠️ 索引热加载失败，继续使用当前版本: {e}")
+
+    app.state.index_watch_task = asyncio.create_task(_watch())
+
+
 @app.post("/webhook")
-async def handle_issue_webhook(payload: IssueWebhook, background_tasks: BackgroundTasks):
+async def handle_issue_webhook(payload: IssueWebhook):
     """GitHub Issue Webhook 入口"""
     data = payload.dict()
     issue = data["issue"]
@@ -75,31 +151,72 @@ async def handle_issue_webhook(payload: IssueWebhook, background_tasks: Backgrou
     print("="*50)
     print(f"📬 收到 Webhook: {data['action']} on {repo_name}#{issue_number}")
     print(f"🔗 Issue URL: {issue.get('html_url')}")
-    # 拉取评论
-    comments = fetch_issue_comments(repo_name, issue_number)
-    print(f"💬 拉取到 {len(comments)} 条评论")
 
-    # 构造 IssueState
+    # 构造 IssueState（评论在任务执行时再拉取）
     issue_state = IssueState(
+        repo_full_name=repo_name,
         issue_url=issue.get("html_url", ""),
         issue_id=str(issue_number),
         issue_title=issue.get("title", ""),
         issue_body=issue.get("body", ""),
-        comments=comments,
+        comments=[],
         need_reply=True,
     )
 
+    job_id = None
     if data['action'] in ['created', 'opened']:
-        background_tasks.add_task(process_issue, issue_state)
+        try:
+            job_id = await job_queue.enqueue(
+                issue_state, key=f"{repo_name}#{issue_number}", delay=DEBOUNCE_SECONDS
+            )
+        except QueueFullError as e:
+            print(f"🚧 {e}")
+            return JSONResponse(status_code=503, content={"status": "busy", "message": str(e)})
 
     # 快速返回响应
     return {
         "status": "accepted",
         "message": f"Issue #{issue_number} 正在后台处理中 🚀",
-        "comments_count": len(comments)
+        "job_id": job_id,
     }
 
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "Issue Assistant is running 🚀"}
+    return {
+        "status": "ok",
+        "message": "Issue Assistant is running 🚀",
+        "resources": resources.status(),
+        "queue": job_queue.stats(),
+        "github": github.stats,
+        "review_pool": review_pool.status(),
+        "llm_cache": get_llm_cache().stats(),
+    }
+
+
+@app.post("/admin/reload-index")
+async def reload_index(request: Request, force: bool = False):
+    """立即热加载 CURRENT 指向的索引版本；force=true 时即使版本未变也重新加载"""
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return JSONResponse(status_code=401, content={"status": "unauthorized"})
+    try:
+        result = await asyncio.to_thread(resources.reload_retriever, force)
+    except Exception as e:
+        print(f"⚠️ 索引热加载失败，继续使用当前版本: {e}")
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e)})
+    return {"status": "ok", **result}
+
+
+@app.get("/queue")
+def queue_stats():
+    """任务队列深度、最老任务等待时长等指标"""
+    return job_queue.stats()
+
+
+@app.get("/ready")
+def readiness_check():
+    """资源预热完成前返回 503，便于负载均衡等待就绪"""
+    status = resources.status()
+    if not resources.ready:
+        return JSONResponse(status_code=503, content=status)
+    return status